@@ -1,8 +1,9 @@
-import h5py
 import numpy as np
 import csv
 import os
 import matplotlib.pyplot as plt
+from ghost_parser import read_ghost_file, ghost_attributes
+from bh5_writer import write_bh5, BH5StreamWriter
 
 class HDF5_Brillouin_creator:
     def __init__(self):
@@ -24,45 +25,27 @@ class HDF5_Brillouin_creator:
         elif file_extension.lower() == ".tiff":
             # Load .TIFF file format data
             self.raw_data = self.load_tiff_file(filepath)
+        elif file_extension.lower() == ".npy":
+            # Load N-D maps stored as numpy arrays
+            self.raw_data = self.load_npy_file(filepath)
         else:
             raise ValueError(f"Unsupported file format: {file_extension}")
         
         return self.filepath
 
     def load_dat_file(self, filepath):
-        metadata = {}
-        data = []
         name, _ = os.path.splitext(filepath)
-        with open(filepath, 'r') as file:
-            lines = file.readlines()
-            # Extract metadata
-            for line in lines:
-                if line.strip() == '':
-                    continue  # Skip empty lines
-                if any(char.isdigit() for char in line.split()[0]):
-                    break  # Stop at the first number
-                else:
-                    # Split metadata into key-value pairs
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        metadata[key.strip()] = value.strip()
-            # Extract numerical data
-            for line in lines:
-                if line.strip().isdigit():
-                    data.append(int(line.strip()))
-        data = np.array(data)
+        metadata, data = read_ghost_file(filepath)
+        self.attributes.update(ghost_attributes(name, metadata, data))
+        return data
+
+    def load_npy_file(self, filepath):
+        """Loads an N-D array whose last axis holds the spectral channels. The file is memory-mapped, not read."""
+        data = np.load(filepath, mmap_mode='r')
+        name, _ = os.path.splitext(filepath)
         self.attributes['FILEPROP.BLS_HDF5_Version'] = '0.1'
         self.attributes['FILEPROP.Name'] = name
-        self.attributes['MEASURE.Sample'] = metadata["Sample"]
-        self.attributes['SPECTROMETER.Scanning_Strategy'] = "point_scanning"
-        self.attributes['SPECTROMETER.Type'] = "TFP"
-        self.attributes['SPECTROMETER.Illumination_Type'] = "CW"
-        self.attributes['SPECTROMETER.Detector_Type'] = "Photon Counter"
-        self.attributes['SPECTROMETER.Filtering_Module'] = "None"
-        self.attributes['SPECTROMETER.Wavelength_nm'] = metadata["Wavelength"]
-        self.attributes['SPECTROMETER.Scan_Amplitude'] = metadata["Scan amplitude"]
-        spectral_resolution = float(float(metadata["Scan amplitude"])/data.shape[-1])
-        self.attributes['SPECTROMETER.Spectral_Resolution'] = str(spectral_resolution)
+        self.attributes['MEASURE.Dimensionnality_of_measure'] = str(data.ndim-1)
         return data
 
     def define_abscissa(self, min_val, max_val, nb_samples):
@@ -107,25 +90,33 @@ class HDF5_Brillouin_creator:
         self.impulse_response = np.loadtxt(filepath)
         return self.impulse_response
 
-    def save_hdf5_as(self, save_filepath):
-        """Saves the data and attributes to an HDF5 file."""
-        with h5py.File(save_filepath, 'w') as hdf5_file:
-            # Save attributes
-            for key, value in self.attributes.items():
-                hdf5_file.attrs[key] = value
-            
-            # Save datasets if they exist
-            if self.raw_data is not None:
-                hdf5_file.create_dataset('Raw_Data', data=self.raw_data)
-            if self.abscissa is not None:
-                hdf5_file.create_dataset('Abscissa', data=self.abscissa)
-            if self.calibration_curve is not None:
-                hdf5_file.create_dataset('Calibration_Curve', data=self.calibration_curve)
-            if self.impulse_response is not None:
-                hdf5_file.create_dataset('Impulse_Response', data=self.impulse_response)
-
-        print(f"Data saved to {save_filepath}")
+    def save_hdf5_as(self, save_filepath, **layout):
+        """Saves the data and attributes to an HDF5 file. The layout keywords are passed to bh5_writer.write_bh5.
 
+        For N-D maps, chunks="spectra" with a compression filter allows to read a single spectrum or z-plane without reading the whole file.
+        """
+        # Save datasets if they exist
+        others = {}
+        if self.abscissa is not None:
+            others['Abscissa'] = self.abscissa
+        if self.calibration_curve is not None:
+            others['Calibration_Curve'] = self.calibration_curve
+        if self.impulse_response is not None:
+            others['Impulse_Response'] = self.impulse_response
 
+        # Save attributes and datasets in a single open
+        write_bh5(save_filepath, self.raw_data, self.attributes, dataset='Raw_Data', others=others, **layout)
 
+        print(f"Data saved to {save_filepath}")
 
+    def stream_hdf5_as(self, save_filepath, map_shape, nb_channels, **kwargs):
+        """Creates an HDF5 file with the attributes and curves stored so far and returns a BH5StreamWriter to append spectra as they are acquired."""
+        others = {}
+        if self.abscissa is not None:
+            others['Abscissa'] = self.abscissa
+        if self.calibration_curve is not None:
+            others['Calibration_Curve'] = self.calibration_curve
+        if self.impulse_response is not None:
+            others['Impulse_Response'] = self.impulse_response
+
+        return BH5StreamWriter(save_filepath, self.attributes, map_shape, nb_channels, dataset='Raw_Data', others=others, **kwargs)
@@ -0,0 +1,100 @@
+import argparse
+import configparser
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from database_manager import DatabaseManager
+from fit_results import store_fit_results
+from recipe import load_recipe, replay, fits_spectra
+
+# Treatment of the spectra without the user interface: no module of this file imports PyQt5
+
+def _replay_safely(args):
+    """Wraps replay so that a failing chunk of files doesn't stop the pool."""
+    filepaths, recipe = args
+    try:
+        return filepaths, replay(filepaths, recipe)[1]
+    except Exception as e:
+        return filepaths, [(filepath, f"{type(e).__name__}: {e}") for filepath in filepaths]
+
+class BatchTreatment:
+    def __init__(self, db_manager, max_workers=None, files_per_task=256):
+        self.db_manager = db_manager
+        self.max_workers = max_workers
+        self.files_per_task = files_per_task
+        self.cancelled = False
+
+    def cancel(self):
+        """Stops the treatment: remaining files are skipped."""
+        self.cancelled = True
+
+    def run(self, recipe, filters=None, progress=None, failure=None):
+        """Treats the BH5 files of the spectra of the database matching the filters (column: value) in a process pool.
+
+        Steps that were already applied with the same parameters on the same data are skipped. The fits of the treated
+        files are then copied to the fit results table of the database.
+        progress(done, total) is called after each chunk of files and failure(filepath, message) for each file that couldn't be treated.
+        Returns the list of treated filepaths and the list of (filepath, message) failures.
+        """
+        filepaths = self.db_manager.filepaths(**(filters or {}))
+        treated, failures = [], []
+        total = len(filepaths)
+        if progress is not None: progress(0, total)
+        if not filepaths: return treated, failures
+
+        # Each process replays the recipe on a chunk of files, so that their spectra are treated together
+        workers = self.max_workers or os.cpu_count() or 1
+        chunk = max(1, min(self.files_per_task, -(-total//workers)))
+        tasks = [(filepaths[i:i + chunk], recipe) for i in range(0, total, chunk)]
+        done = 0
+        fits = fits_spectra(recipe)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            for chunk_filepaths, chunk_failures in executor.map(_replay_safely, tasks):
+                failed = dict(chunk_failures)
+                for filepath in chunk_filepaths:
+                    if filepath not in failed: treated.append(filepath)
+                for filepath, error in chunk_failures:
+                    failures.append((filepath, error))
+                    if failure is not None: failure(filepath, error)
+                # The fits are mirrored in the database by the calling process, the only writer of the database
+                if fits: store_fit_results(self.db_manager, [e for e in chunk_filepaths if e not in failed])
+                done += len(chunk_filepaths)
+                if progress is not None: progress(done, total)
+                if self.cancelled: break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return treated, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Treats the spectra of a database with a recipe, without the user interface.")
+    parser.add_argument("database", help="SQLite database of the spectra")
+    parser.add_argument("recipe", help="JSON recipe of the treatment steps")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default: number of CPUs)")
+    parser.add_argument("-f", "--filter", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="only treat the spectra whose database column has the given value (can be repeated)")
+    parser.add_argument("-c", "--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini"),
+                        help="configuration file (default: config.ini of the interface)")
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    filters = dict(e.split("=", 1) for e in args.filter)
+    recipe = load_recipe(args.recipe)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} files treated", end="", file=sys.stderr, flush=True)
+    def failure(filepath, message):
+        print(f"\n{filepath}: {message}", file=sys.stderr)
+
+    db_manager = DatabaseManager(args.database, config)
+    db_manager.connect(compatibility=True)
+
+    treated, failures = BatchTreatment(db_manager, args.workers).run(recipe, filters, progress, failure)
+    print(f"\n{len(treated)} files treated, {len(failures)} failures", file=sys.stderr)
+    db_manager.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import glob
+import os
+import sys
+import tempfile
+import time
+import h5py
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from ghost_parser import read_ghost_file, ghost_attributes
+from bh5_writer import write_bh5
+
+layouts = {"int64, contiguous": {"dtype": "int64"},
+           "auto dtype": {"dtype": "auto"},
+           "auto dtype, lzf": {"dtype": "auto", "compression": "lzf", "shuffle": True},
+           "auto dtype, gzip 4": {"dtype": "auto", "compression": "gzip", "compression_opts": 4, "shuffle": True}}
+
+def legacy_write(filepath, data, attributes):
+    """Reference implementation: dataset written first, attributes added by reopening the file."""
+    with h5py.File(filepath, 'w') as f:
+        f.create_group('Data').create_dataset('Raw_data', data = data)
+    with h5py.File(filepath, 'a') as f:
+        for key, value in attributes.items():
+            f.attrs[key] = value
+
+def measure(write, spectra, directory, repeat):
+    """Returns the number of files written per second and the mean size of a file."""
+    start = time.perf_counter()
+    for i in range(repeat):
+        for j, (data, attributes) in enumerate(spectra):
+            write(f"{directory}/{i}_{j}.bh5", data, attributes)
+    elapsed = time.perf_counter() - start
+    sizes = [os.path.getsize(e) for e in glob.glob(f"{directory}/*.bh5")]
+    return repeat*len(spectra)/elapsed, sum(sizes)/len(sizes)
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    spectra = []
+    for filepath in sorted(glob.glob(os.path.join(loc, "test_files", "Spectrum_*.DAT"))):
+        metadata, data = read_ghost_file(filepath)
+        spectra.append((data, ghost_attributes("benchmark", metadata, data)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        rate, size = measure(legacy_write, spectra, directory, repeat)
+    print(f"{'write + reopen (previous)':28s} {rate:8.1f} files/s {size/1024:8.1f} kB/file")
+    for name, layout in layouts.items():
+        with tempfile.TemporaryDirectory() as directory:
+            rate, size = measure(lambda filepath, data, attributes: write_bh5(filepath, data, attributes, **layout), spectra, directory, repeat)
+        print(f"{name:28s} {rate:8.1f} files/s {size/1024:8.1f} kB/file")
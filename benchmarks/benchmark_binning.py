@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from lazy_data import LazyDataset, block_slices
+from treatment import bin_rois
+
+def bin_whole(filepath, rois):
+    """Stack read at once, then summed over each ROI of the frames one after the other."""
+    with h5py.File(filepath, 'r') as f:
+        stack = f["Data"]["Raw_data"][...]
+    return np.stack([stack[:, slice(*rows), slice(*columns)].sum(axis=(1, 2)) for rows, columns in rois])
+
+if __name__ == "__main__":
+    nb_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nb_rows, nb_columns = [int(e) for e in sys.argv[2:4]] if len(sys.argv) > 3 else (512, 512)
+    rng = np.random.default_rng(0)
+    # Four bands of lines of the frames of a camera, binned into a spectrum of the columns for each frame
+    rois = [[(start, start + 40), (0, nb_columns)] for start in range(100, 100 + 4*60, 60)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        shape = (nb_frames, nb_rows, nb_columns)
+        for layout, parameters in (("contiguous", {}), ("chunked gzip", {"chunks": (1, 64, nb_columns), "compression": "gzip", "compression_opts": 1})):
+            filepath = os.path.join(directory, "stack.bh5")
+            write_bh5(filepath, None, {"MEASURE.Date_of_measure": "now"})
+            with h5py.File(filepath, 'a') as f:
+                # Written by blocks of whole chunks, the stack can be larger than the memory
+                dataset = f.create_dataset("Data/Raw_data", shape=shape, dtype=np.uint16, **parameters)
+                for index in block_slices(shape, 2, dataset.chunks, 2**24):
+                    dataset[index] = rng.poisson(100, [e.stop - e.start for e in index] + [nb_columns])
+            size = np.prod(shape)*2/2**20
+            for name, function in (("read whole", lambda: bin_whole(filepath, rois)),
+                                   ("streamed", lambda: bin_rois(LazyDataset(filepath), [1], [[window] for window, _ in rois]))):
+                tracemalloc.start()
+                start = time.perf_counter()
+                function()
+                duration = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]/2**20
+                tracemalloc.stop()
+                print(f"{nb_frames} frames of {nb_rows}x{nb_columns} ({size:.0f} MB), {layout + ',':13} {name + ':':11} {1e3*duration:8.1f} ms, peak memory {peak:6.0f} MB")
+            os.remove(filepath)
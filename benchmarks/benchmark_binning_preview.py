@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from treatment import bin_image, binning_prefix, bin_prefix
+from blitting import BlitLine
+from decimation import imshow_pyramid
+
+def redraw_preview(ax, image, windows):
+    """Previous preview: sum of the window, lines plotted again and whole figure drawn at each change."""
+    for start, stop in windows:
+        y = bin_image(image, "H", start, stop)
+        for line in ax.get_lines():
+            line.remove()
+        ax.plot(np.arange(y.size), y, 'r')
+        ax.figure.canvas.draw()
+
+def blit_preview(ax, image, windows):
+    """Current preview: window binned from the cumulative sums and line blitted over the cached background."""
+    prefix = binning_prefix(image, "H")
+    line = None
+    for start, stop in windows:
+        y = bin_prefix(prefix, start, stop)
+        if line is None: line = BlitLine(ax, np.arange(y.size), y, 'r')
+        line.set_data(np.arange(y.size), y)
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nb_changes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    image = np.random.default_rng(0).poisson(100, (size, size)).astype(np.float32)
+    # Successive values of the stop spinbox, as when it is scrolled
+    windows = [(0, stop) for stop in np.linspace(size//10, size, nb_changes).astype(int)]
+
+    for name, preview in (("recompute and redraw", redraw_preview), ("prefix and blitting", blit_preview)):
+        fig, ax = plt.subplots(figsize=(8, 6))
+        imshow_pyramid(ax, image)
+        fig.canvas.draw()
+        start = time.perf_counter()
+        preview(ax, image, windows)
+        duration = time.perf_counter() - start
+        plt.close(fig)
+        print(f"{size}x{size} image, {name + ':':22} {1e3*duration/nb_changes:7.2f} ms per change of the window")
@@ -0,0 +1,68 @@
+import configparser
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from database_manager import DatabaseManager
+
+class UnindexedDatabaseManager(DatabaseManager):
+    """Database as it was before the indexes: a new connection with the default pragmas for each operation."""
+    def connect(self, compatibility=False):
+        return sqlite3.connect(self.db_path)
+
+    def migrate(self):
+        pass
+
+def spectra(nb_spectra):
+    for i in range(nb_spectra):
+        yield f"spectrum_{i}", (512,), f"/data/spectrum_{i}.bh5", {"sample": f"sample_{i%100}"}
+
+def benchmark(db_manager, nb_spectra, nb_lookups, batch_size=1000):
+    """Returns the insertion rates (by batches and one by one) and the lookup rate of a database."""
+    db_manager.create_table()
+    new_spectra = spectra(nb_spectra)
+    start = time.perf_counter()
+    for _ in range(0, nb_spectra, batch_size):
+        db_manager.add_spectra([next(new_spectra) for _ in range(batch_size)])
+    insert = nb_spectra/(time.perf_counter() - start)
+
+    # Spectra added one by one, as when a single file is imported
+    data = np.empty(512)
+    start = time.perf_counter()
+    for i in range(nb_lookups):
+        db_manager.add_spectrum(f"single_{i}", data, f"/data/single_{i}.bh5")
+    single = nb_lookups/(time.perf_counter() - start)
+
+    # Lookups done by the interface: duplicates at import, spectrum of a file and spectra of a sample
+    indices = np.random.default_rng(0).integers(0, nb_spectra, nb_lookups)
+    start = time.perf_counter()
+    for i in indices:
+        db_manager.names_in_db([f"spectrum_{i}"])
+        with db_manager.connect() as conn:
+            conn.execute("SELECT id FROM spectra WHERE filepath = ?", (f"/data/spectrum_{i}.bh5",)).fetchall()
+        db_manager.filepaths(sample=f"sample_{i%100}")
+    lookup = nb_lookups/(time.perf_counter() - start)
+    return insert, single, lookup
+
+if __name__ == "__main__":
+    nb_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nb_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(loc, "config.ini"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        insert_before, single_before, lookup_before = benchmark(UnindexedDatabaseManager(os.path.join(directory, "before.db"), config), nb_spectra, nb_lookups)
+        db_manager = DatabaseManager(os.path.join(directory, "after.db"), config)
+        insert_after, single_after, lookup_after = benchmark(db_manager, nb_spectra, nb_lookups)
+        db_manager.close()
+
+    print(f"Without indexes, batched insertion: {insert_before:10.1f} spectra/s, single insertion: {single_before:8.1f} spectra/s, lookup: {lookup_before:8.1f} lookups/s")
+    print(f"Indexed in WAL, batched insertion:  {insert_after:10.1f} spectra/s, single insertion: {single_after:8.1f} spectra/s, lookup: {lookup_after:8.1f} lookups/s")
@@ -0,0 +1,75 @@
+import configparser
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from database_manager import DatabaseManager
+from fit_results import store_fit_results
+from treatment import write_treated_group
+
+def create_database(directory, nb_spectra, nb_files):
+    """Creates a database of spectra of 100 samples whose DHO fits are stored in the fit results table.
+
+    Only the first nb_files spectra have a BH5 file, to measure the time needed to read the fits from the files.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(loc, "config.ini"))
+    db_manager = DatabaseManager(os.path.join(directory, "spectra.db"), config)
+    db_manager.create_table()
+    db_manager.add_spectra([(f"spectrum_{i}", (512,), os.path.join(directory, f"spectrum_{i}.bh5"), {"sample": f"sample_{i%100}"})
+                            for i in range(nb_spectra)])
+
+    rng = np.random.default_rng(0)
+    results = {"Shift": rng.normal(7.5, 0.1, nb_spectra), "Shift_Uncertainty": rng.uniform(0, 0.01, nb_spectra),
+               "Linewidth": rng.normal(0.5, 0.05, nb_spectra), "Amplitude": rng.uniform(100, 200, nb_spectra),
+               "Offset": rng.uniform(0, 10, nb_spectra), "Converged": np.ones(nb_spectra, dtype=bool)}
+    ids = db_manager.ids_by_filepath(os.path.join(directory, f"spectrum_{i}.bh5") for i in range(nb_spectra))
+    rows = [(ids[os.path.join(directory, f"spectrum_{i}.bh5")], "DHO", 0, results["Shift"][i], results["Shift_Uncertainty"][i],
+             results["Linewidth"][i], None, results["Amplitude"][i], None, results["Offset"][i], 1, None) for i in range(nb_spectra)]
+    db_manager.replace_fit_results(ids.values(), rows)
+
+    for i in range(nb_files):
+        with h5py.File(os.path.join(directory, f"spectrum_{i}.bh5"), 'w') as f:
+            f.create_group("Data")
+            write_treated_group(f["Data"], "DHO_fit", {k: v[i:i+1] for k, v in results.items()}, "Raw_data", Fit_Model="DHO")
+    return db_manager
+
+if __name__ == "__main__":
+    nb_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nb_files = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager = create_database(directory, nb_spectra, nb_files)
+        filepaths = [os.path.join(directory, f"spectrum_{i}.bh5") for i in range(nb_files)]
+
+        # Shifts read from every BH5 file, as without the results table
+        start = time.perf_counter()
+        for filepath in filepaths:
+            with h5py.File(filepath, 'r') as f:
+                f["Data"]["DHO_fit"]["Shift"][...]
+        from_files = (time.perf_counter() - start)*nb_spectra/nb_files
+
+        start = time.perf_counter()
+        shifts = db_manager.fit_results(["shift", "sample"], model="DHO", converged=1)
+        from_table = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db_manager.aggregate("shift", by="sample", model="DHO", converged=1)
+        aggregate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store_fit_results(db_manager, filepaths)
+        mirror = time.perf_counter() - start
+        db_manager.close()
+
+    print(f"Shifts of {nb_spectra} spectra read from the BH5 files (extrapolated): {from_files*1e3:10.1f} ms")
+    print(f"Shifts and samples of {shifts['shift'].size} spectra read from the results table: {from_table*1e3:10.1f} ms")
+    print(f"Shift statistics of each sample computed by SQLite:     {aggregate*1e3:10.1f} ms")
+    print(f"Fits of the BH5 files copied to the results table:      {nb_files/mirror:10.1f} files/s")
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+import calibration
+from bh5_writer import write_bh5
+from calibration import read_calibration, build_interpolator
+from treatment import frequency_axis
+
+# (channel, frequency) points of the calibration of a VIPA spectrometer, whose dispersion isn't linear
+points = np.array([[40, -14.1], [300, -7.2], [512, 0.0], [720, 7.6], [980, 16.3]])
+
+def axis_without_cache(f, nb_channels):
+    """Frequency axis built again from the calibration of each file."""
+    name, curve = read_calibration(f)
+    return build_interpolator(name, curve)(np.arange(nb_channels, dtype=float))
+
+if __name__ == "__main__":
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    nb_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    attributes = {"MEASURE.Date_of_measure": "now", "SPECTROMETER.Type": "VIPA"}
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths = [write_bh5(os.path.join(directory, f"{i}.bh5"), np.ones((4, nb_channels), dtype=np.uint16), attributes,
+                               others={"Calibration_Curve": points}) for i in range(nb_files)]
+        files = [h5py.File(filepath, 'r') for filepath in filepaths]
+        # The files are opened beforehand, only the axes are timed
+        for name, function in (("built for each file", axis_without_cache), ("cached", frequency_axis)):
+            calibration.interpolators.clear()
+            calibration.axes.clear()
+            start = time.perf_counter()
+            for f in files:
+                function(f, nb_channels)
+            duration = time.perf_counter() - start
+            print(f"{nb_files} files of {nb_channels} channels, axis {name + ':':20} {1e3*duration:8.1f} ms ({1e6*duration/nb_files:6.1f} us per file)")
+        for f in files:
+            f.close()
@@ -0,0 +1,55 @@
+import glob
+import os
+import sys
+import time
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from ghost_parser import read_ghost_file
+
+def legacy_read_ghost_file(filepath):
+    """Reference implementation: the readlines loop previously used to import GHOST files."""
+    metadata = {}
+    data = []
+    with open(filepath, 'r') as file:
+        lines = file.readlines()
+        for line in lines:
+            if line.strip() == '':
+                continue
+            if any(char.isdigit() for char in line.split()[0]):
+                break
+            else:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    metadata[key.strip()] = value.strip()
+        for line in lines:
+            if line.strip().isdigit():
+                data.append(int(line.strip()))
+    return metadata, np.array(data)
+
+def files_per_second(function, filepaths, repeat):
+    """Returns the number of files parsed per second by the given function."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for filepath in filepaths:
+            function(filepath)
+    return repeat*len(filepaths)/(time.perf_counter() - start)
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    filepaths = sorted(glob.glob(os.path.join(loc, "test_files", "Spectrum_*.DAT")))
+
+    # Both parsers have to agree before comparing them
+    for filepath in filepaths:
+        metadata_legacy, data_legacy = legacy_read_ghost_file(filepath)
+        metadata, data = read_ghost_file(filepath)
+        assert metadata == metadata_legacy and np.array_equal(data, data_legacy), filepath
+
+    legacy = files_per_second(legacy_read_ghost_file, filepaths, repeat)
+    vectorized = files_per_second(read_ghost_file, filepaths, repeat)
+    print(f"Legacy readlines loop: {legacy:10.1f} files/s")
+    print(f"Vectorized parser:     {vectorized:10.1f} files/s")
+    print(f"Speed-up:              {vectorized/legacy:10.1f} x")
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from lazy_data import LazyDataset
+from treatment import bin_image
+
+layouts = {"contiguous": {},
+           "chunked gzip": {"chunks": "spectra", "compression": "gzip", "compression_opts": 1, "shuffle": True}}
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start)*1e3
+
+if __name__ == "__main__":
+    nx, ny, nb_channels = [int(e) for e in sys.argv[1:4]] if len(sys.argv) > 3 else (256, 256, 1024)
+    data = np.random.default_rng(0).poisson(100, (nx, ny, nb_channels)).astype(np.uint16)
+    print(f"Map of {nx}x{ny} spectra of {nb_channels} channels ({data.nbytes/2**20:.0f} MB)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for layout, parameters in layouts.items():
+            filepath = os.path.join(directory, layout.replace(" ", "_")+".bh5")
+            write_bh5(filepath, data, {}, **parameters)
+
+            def read_all():
+                with h5py.File(filepath, 'r') as f: f["Data"]["Raw_data"][:]
+            def open_and_read_spectrum():
+                LazyDataset(filepath).spectrum((nx//2, ny//2))
+            def bin_slab():
+                bin_image(LazyDataset(filepath)[:, ny//2], "H", 100, 200)
+            def stream():
+                for _, block in LazyDataset(filepath).iter_blocks(): block.sum()
+
+            print(f"{layout:>12}: full read {timed(read_all):8.1f} ms, one spectrum {timed(open_and_read_spectrum):6.2f} ms, "
+                  f"binning of a z-plane {timed(bin_slab):6.2f} ms, streamed sum {timed(stream):8.1f} ms")
@@ -0,0 +1,60 @@
+import configparser
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from database_manager import DatabaseManager
+from metadata_sync import attribute_columns, sync_metadata
+
+def create_database(directory, nb_files):
+    """Creates a database of BH5 files holding all the attributes of the "Attribute Columns" section of the configuration."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(loc, "config.ini"))
+    db_manager = DatabaseManager(os.path.join(directory, "spectra.db"), config)
+    db_manager.create_table()
+    attributes = {attribute: "1" for attribute in attribute_columns(config).values()}
+    spectra = []
+    for i in range(nb_files):
+        filepath = os.path.join(directory, f"spectrum_{i}.bh5")
+        write_bh5(filepath, np.zeros(512, dtype=np.uint16), attributes)
+        spectra.append((f"spectrum_{i}", (512,), filepath, {}))
+    db_manager.add_spectra(spectra)
+    return db_manager
+
+if __name__ == "__main__":
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager = create_database(directory, nb_files)
+        mapping = attribute_columns(db_manager.config)
+        filepaths = db_manager.filepaths()
+
+        # One file and one UPDATE at a time, as before the synchronisation
+        start = time.perf_counter()
+        for filepath in filepaths:
+            with h5py.File(filepath, 'r') as f:
+                updates = {column: f.attrs[attribute] for column, attribute in mapping.items()}
+            db_manager.update_database_by_filepath(filepath, updates)
+        per_file = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sync_metadata(db_manager)
+        synced = time.perf_counter() - start
+
+        # No file changed: every file is skipped
+        start = time.perf_counter()
+        sync_metadata(db_manager)
+        skipped = time.perf_counter() - start
+        db_manager.close()
+
+    print(f"Update file by file:          {nb_files/per_file:10.1f} files/s")
+    print(f"Synchronisation:              {nb_files/synced:10.1f} files/s")
+    print(f"Synchronisation of unchanged: {nb_files/skipped:10.1f} files/s")
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from lazy_data import block_slices
+from recipe import apply_step
+from treatment import noise_mask, subtract_noise_average
+
+windows = [[0, 40], [470, 511]]
+
+def subtract_loop(spectra, mask):
+    """Noise subtraction spectrum by spectrum."""
+    result = np.empty(spectra.shape, dtype=np.float32)
+    for i, spectrum in enumerate(spectra):
+        result[i] = spectrum - np.mean(spectrum[mask])
+    return result
+
+if __name__ == "__main__":
+    nb_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nx, ny = [int(e) for e in sys.argv[2:4]] if len(sys.argv) > 3 else (500, 500)
+    nb_channels = 512
+    rng = np.random.default_rng(0)
+    mask = noise_mask(np.arange(nb_channels), windows)
+
+    spectra = rng.poisson(100, (nb_spectra, nb_channels)).astype(np.uint16)
+    start = time.perf_counter()
+    subtract_loop(spectra, mask)
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    subtract_noise_average(spectra, mask)
+    vectorized = time.perf_counter() - start
+    print(f"{nb_spectra} spectra in memory: loop {1e3*loop:8.1f} ms, vectorized {1e3*vectorized:8.1f} ms")
+
+    # Map treated by blocks of spectra, with the memory allocated during the treatment
+    with tempfile.TemporaryDirectory() as directory:
+        for layout, parameters in (("contiguous", {}), ("chunked gzip", {"chunks": "spectra", "compression": "gzip", "compression_opts": 1, "shuffle": True})):
+            filepath = os.path.join(directory, "map.bh5")
+            write_bh5(filepath, np.zeros((nx, ny, nb_channels), dtype=np.uint16), {"MEASURE.Date_of_measure": "now"}, **parameters)
+            with h5py.File(filepath, 'a') as f:
+                # Written by blocks of whole chunks
+                for index in block_slices((nx, ny, nb_channels), 2, f["Data"]["Raw_data"].chunks, 2**24):
+                    f["Data"]["Raw_data"][index] = rng.poisson(100, [e.stop - e.start for e in index] + [nb_channels])
+                # The raw data changed after it was hashed
+                del f["Data"]["Raw_data"].attrs["Content_Hash"]
+            size = nx*ny*nb_channels*2/2**20
+            tracemalloc.start()
+            start = time.perf_counter()
+            apply_step(filepath, {"treatment": "Subtract Noise", "windows": windows, "unit": "channel"})
+            duration = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]/2**20
+            tracemalloc.stop()
+            print(f"{nx}x{ny} map ({size:.0f} MB), {layout + ':':14} {duration:6.1f} s ({nx*ny/duration:9.0f} spectra/s), peak memory {peak:6.0f} MB")
+            os.remove(filepath)
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from recipe import apply_step
+from treatment import normalize_peaks
+
+scan_amplitude = 30
+
+def tfp_spectra(frequency, drift, shift=7.5, rng=None):
+    """Counts of TFP spectra with an elastic peak drifting by drift and a Brillouin doublet at +-shift from it."""
+    x = frequency - drift[..., np.newaxis]
+    y = 1000/(1 + (x/0.1)**2) + 200/(1 + ((np.abs(x) - shift)/0.3)**2) + 5
+    return rng.poisson(y).astype(np.uint16)
+
+def normalize_loop(frequency, spectra, exclusion):
+    """Peaks found spectrum by spectrum, refined by the parabola through the highest channel and its neighbours."""
+    elastic = np.abs(frequency) <= exclusion
+    channels = np.arange(frequency.size)
+    result = np.empty(spectra.shape, dtype=np.float32)
+    shifts = np.empty(spectra.shape[0])
+    for i, spectrum in enumerate(spectra.astype(float)):
+        positions = []
+        for inside in (elastic, ~elastic):
+            j = np.flatnonzero(inside)[np.argmax(spectrum[inside])]
+            left, center, right = spectrum[j - 1], spectrum[j], spectrum[j + 1]
+            delta = 0.5*(left - right)/(left - 2*center + right) if left - 2*center + right < 0 else 0
+            positions.append((j + delta, center - 0.25*(left - right)*delta))
+        shifts[i] = np.interp(positions[0][0], channels, frequency)
+        result[i] = spectrum/positions[1][1]
+    return result, shifts
+
+if __name__ == "__main__":
+    nb_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nx, ny = [int(e) for e in sys.argv[2:4]] if len(sys.argv) > 3 else (300, 300)
+    nb_channels = 512
+    rng = np.random.default_rng(0)
+    frequency = np.linspace(-scan_amplitude/2, scan_amplitude/2, nb_channels)
+
+    drift = rng.uniform(-0.5, 0.5, nb_spectra)
+    spectra = tfp_spectra(frequency, drift, rng=rng)
+    start = time.perf_counter()
+    normalize_loop(frequency, spectra, scan_amplitude/8)
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    results = normalize_peaks(frequency, spectra)
+    vectorized = time.perf_counter() - start
+    error = np.sqrt(np.mean((results["Elastic_Shift"] - drift)**2))
+    print(f"{nb_spectra} spectra in memory: loop {1e3*loop:8.1f} ms, vectorized {1e3*vectorized:8.1f} ms, "
+          f"error on the elastic drift {1e3*error:.1f} MHz (channels of {1e3*scan_amplitude/(nb_channels - 1):.1f} MHz)")
+
+    # Map treated by blocks of spectra and written to chunked datasets
+    with tempfile.TemporaryDirectory() as directory:
+        for layout, parameters in (("contiguous", {}), ("chunked gzip", {"chunks": "spectra", "compression": "gzip", "compression_opts": 1, "shuffle": True})):
+            filepath = os.path.join(directory, "map.bh5")
+            write_bh5(filepath, tfp_spectra(frequency, rng.uniform(-0.5, 0.5, (nx, ny)), rng=rng),
+                      {"MEASURE.Date_of_measure": "now", "SPECTROMETER.Type": "TFP", "SPECTROMETER.Scan_Amplitude": str(scan_amplitude)}, **parameters)
+            start = time.perf_counter()
+            apply_step(filepath, {"treatment": "Normalize"})
+            duration = time.perf_counter() - start
+            with h5py.File(filepath, 'r') as f:
+                chunks = f["Data"]["Normalized"]["Spectra"].chunks
+            print(f"{nx}x{ny} map, {layout + ':':14} {duration:6.1f} s ({nx*ny/duration:9.0f} spectra/s), chunks of the results {chunks}")
+            os.remove(filepath)
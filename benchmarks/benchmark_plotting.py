@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from decimation import plot_decimated, imshow_pyramid
+
+def draw_time(plot):
+    """Returns the time needed to plot and draw a figure, and to draw it again after zooming on its center."""
+    fig, ax = plt.subplots(figsize=(8, 6))
+    start = time.perf_counter()
+    plot(ax)
+    fig.canvas.draw()
+    first = time.perf_counter() - start
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    start = time.perf_counter()
+    ax.set_xlim(np.mean(xlim) + (np.array(xlim) - np.mean(xlim))/10)
+    ax.set_ylim(np.mean(ylim) + (np.array(ylim) - np.mean(ylim))/10)
+    fig.canvas.draw()
+    zoom = time.perf_counter() - start
+    plt.close(fig)
+    return first, zoom
+
+if __name__ == "__main__":
+    nb_spectra = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    nb_points = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    frame_size = int(sys.argv[3]) if len(sys.argv) > 3 else 4000
+    rng = np.random.default_rng(0)
+    x = np.arange(nb_points)
+    spectra = rng.poisson(100, (nb_spectra, nb_points)).astype(float)
+    frame = rng.random((frame_size, frame_size)).astype(np.float32)
+
+    def plot_lines(ax):
+        for y in spectra: ax.plot(x, y)
+    def plot_decimated_lines(ax):
+        for y in spectra: plot_decimated(ax, x, y)
+
+    for name, plot in (("ax.plot", plot_lines), ("decimated", plot_decimated_lines),
+                       ("ax.imshow", lambda ax: ax.imshow(frame)), ("pyramid", lambda ax: imshow_pyramid(ax, frame))):
+        first, zoom = draw_time(plot)
+        data = f"{nb_spectra} spectra of {nb_points} points" if name in ("ax.plot", "decimated") else f"{frame_size}x{frame_size} frame"
+        print(f"{data + ', ' + name + ':':45} draw {1e3*first:8.1f} ms, zoom {1e3*zoom:8.1f} ms")
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, loc)
+
+from bh5_writer import write_bh5
+from fitting import LorentzianDoublet, fit_bh5
+from recipe import replay
+
+def create_files(directory, nb_files, nb_channels=512):
+    """Creates BH5 files holding one synthetic TFP spectrum each."""
+    rng = np.random.default_rng(0)
+    x = np.linspace(-8, 8, nb_channels)
+    attributes = {"SPECTROMETER.Type": "TFP", "SPECTROMETER.Scan_Amplitude": "16", "MEASURE.Date_of_measure": "benchmark"}
+    filepaths = []
+    for i in range(nb_files):
+        shift = rng.uniform(5.5, 6.5)
+        y = 5 + 100/(1 + (2*(x - shift)/.5)**2) + 100/(1 + (2*(x + shift)/.5)**2)
+        filepaths.append(write_bh5(os.path.join(directory, f"spectrum_{i}.bh5"), rng.poisson(y), attributes))
+    return filepaths
+
+if __name__ == "__main__":
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    recipe = {"steps": [{"treatment": "Fit", "model": "Lorentzian", "elastic_compensation": False}]}
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths = create_files(directory, nb_files)
+
+        start = time.perf_counter()
+        for filepath in filepaths:
+            fit_bh5(filepath, LorentzianDoublet())
+        per_file = time.perf_counter() - start
+
+        start = time.perf_counter()
+        replay(filepaths, recipe)
+        stacked = time.perf_counter() - start
+
+        # Nothing changed: every step is skipped
+        start = time.perf_counter()
+        replay(filepaths, recipe)
+        skipped = time.perf_counter() - start
+
+    print(f"Fit file by file:       {nb_files/per_file:10.1f} files/s")
+    print(f"Recipe replay:          {nb_files/stacked:10.1f} files/s")
+    print(f"Replay of treated data: {nb_files/skipped:10.1f} files/s")
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# Allow the benchmark to be run from any directory
+loc = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that shouldn't be loaded before the main window is displayed
+deferred = ("matplotlib", "h5py", "PIL", "scipy", "pyperclip")
+
+# Script creating and displaying the main window, then listing the deferred modules already loaded
+show_window = f"""
+import sys
+sys.path.insert(0, {loc!r})
+from PyQt5.QtWidgets import QApplication
+import main
+app = QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+app.processEvents()
+print(",".join(e for e in {deferred!r} if e in sys.modules))
+"""
+
+def import_times():
+    """Returns the cumulative import time (ms) of main and of each module it imports directly, from python -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=loc, capture_output=True, text=True, check=True)
+    times, depths = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()))//2
+        times[name.strip()], depths[name.strip()] = int(cumulative)/1e3, depth
+    main_depth = depths["main"]
+    return times["main"], {name: t for name, t in times.items() if depths[name] == main_depth + 1}
+
+def window_time():
+    """Returns the time (ms) from the start of Python to the display of the main window, and the deferred modules loaded."""
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY"): env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", show_window], cwd=loc, capture_output=True, text=True, env=env, check=True)
+    return (time.perf_counter() - start)*1e3, [e for e in result.stdout.strip().split(",") if e]
+
+if __name__ == "__main__":
+    nb_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # The first run fills the cache of the file system, the median of the others is reported
+    import_times()
+    runs = [import_times() for _ in range(nb_runs)]
+    print(f"import main: {np.median([e[0] for e in runs]):7.1f} ms")
+    modules = runs[-1][1]
+    for name in sorted(modules, key=modules.get, reverse=True)[:8]:
+        print(f"    {name:25} {np.median([e[1].get(name, 0) for e in runs]):7.1f} ms")
+
+    window_time()
+    runs = [window_time() for _ in range(nb_runs)]
+    loaded = runs[-1][1]
+    print(f"main window displayed after {np.median([e[0] for e in runs]):7.1f} ms (interpreter start included), "
+          f"deferred modules loaded: {', '.join(loaded) if loaded else 'none'}")
@@ -0,0 +1,208 @@
+import time
+import hashlib
+import h5py
+import numpy as np
+
+def count_dtype(data):
+    """Returns the smallest unsigned integer type able to store the counts of the data, or the type of the data if they are
+    not counts or no unsigned type is smaller."""
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.integer) or data.size == 0:
+        return data.dtype
+    if data.min() < 0:
+        return data.dtype
+    maximum = data.max()
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if maximum <= np.iinfo(dtype).max:
+            # The counts are never stored wider than they are given
+            return np.dtype(dtype) if np.dtype(dtype).itemsize <= data.dtype.itemsize else data.dtype
+    return data.dtype
+
+def content_digest(data, dtype=None, max_bytes=2**24):
+    """Returns the hash of the shape, type and content of an array or a dataset, read by blocks of about max_bytes
+    along its first axis. dtype is the type the content is hashed as, the type of the data by default."""
+    dtype = np.dtype(dtype if dtype is not None else data.dtype)
+    h = hashlib.sha1(str((data.shape, dtype.str)).encode())
+    if len(data.shape) == 0:
+        h.update(np.ascontiguousarray(data[()], dtype=dtype).tobytes())
+        return h.hexdigest()
+    step = max(1, max_bytes//max(1, dtype.itemsize*int(np.prod(data.shape[1:], dtype=np.int64))))
+    for start in range(0, data.shape[0], step):
+        h.update(np.ascontiguousarray(data[start:start + step], dtype=dtype).tobytes())
+    return h.hexdigest()
+
+def layout_from_config(config):
+    """Returns the layout of the raw data stored in the "BH5 Layout" section of the configuration file."""
+    layout = {}
+    if not config.has_section("BH5 Layout"):
+        return layout
+    section = config["BH5 Layout"]
+
+    dtype = section.get("dtype", "").strip()
+    if dtype not in ("", "none"): layout["dtype"] = dtype
+
+    compression = section.get("compression", "").strip()
+    if compression not in ("", "none"):
+        layout["compression"] = compression
+        if section.get("compression_opts", "").strip() not in ("", "none"):
+            layout["compression_opts"] = section.getint("compression_opts")
+
+    layout["shuffle"] = section.getboolean("shuffle", fallback=False)
+
+    chunks = section.get("chunks", "").strip()
+    if chunks == "auto": layout["chunks"] = True
+    elif chunks == "spectra": layout["chunks"] = "spectra"
+    elif chunks not in ("", "none"): layout["chunks"] = tuple(int(e) for e in chunks.strip("()").split(",") if e.strip())
+    return layout
+
+def spectrum_chunks(shape, dtype, max_bytes=2**20):
+    """Returns a chunk shape holding whole spectra (last axis) of a dataset of the given shape.
+
+    Following the organization of the raw data, the z axis (second to last) is kept to a single plane and the
+    chunk is extended along y, x and then the other leading axes until it reaches max_bytes. Reading one spectrum
+    thus reads a single chunk and reading a z-plane only reads chunks belonging to that plane.
+    """
+    shape = tuple(int(e) for e in shape)
+    if len(shape) == 0: return None
+    chunks = [1]*len(shape)
+    chunks[-1] = max(1, shape[-1])
+    if len(shape) == 1: return tuple(chunks)
+
+    budget = max(1, max_bytes//(chunks[-1]*np.dtype(dtype).itemsize))
+    if len(shape) == 2:
+        axes = [0]
+    else:
+        axes = list(range(len(shape)-3, -1, -1))
+    for axis in axes:
+        chunks[axis] = max(1, min(shape[axis], budget))
+        budget = budget//chunks[axis]
+        if chunks[axis] < shape[axis] or budget <= 1: break
+    return tuple(chunks)
+
+def create_raw_dataset(group, name, data, dtype=None, chunks=None, compression=None, compression_opts=None, shuffle=False):
+    """Creates a dataset with the given layout.
+
+    dtype can be "auto" to store counts with the smallest unsigned integer type. chunks can be None (contiguous
+    unless a filter is used), True (chunk shape guessed by h5py), "spectra" (chunks aligned to whole spectra, see
+    spectrum_chunks) or a tuple. Filtered datasets are chunked along whole spectra unless told otherwise.
+    """
+    if isinstance(dtype, str) and dtype == "auto": dtype = count_dtype(data)
+    if chunks == "spectra" or (chunks is None and (compression is not None or shuffle)):
+        chunks = spectrum_chunks(np.shape(data), dtype or np.asarray(data).dtype)
+    return group.create_dataset(name, data=data, dtype=dtype, chunks=chunks,
+                                compression=compression, compression_opts=compression_opts,
+                                shuffle=shuffle)
+
+def layout_attributes(dataset):
+    """Returns the attributes describing the storage layout of the raw data."""
+    return {'FILEPROP.Chunk_Shape': str(dataset.chunks) if dataset.chunks is not None else "contiguous",
+            'FILEPROP.Compression': dataset.compression if dataset.compression is not None else "none"}
+
+def write_bh5(filepath, data, attributes, dataset="Data/Raw_data", others=None, **layout):
+    """Writes the raw data, the other datasets and the attributes of a BH5 file in a single open.
+
+    The layout keywords (dtype, chunks, compression, compression_opts, shuffle) only apply to the raw data. The hash of
+    the raw data is stored with it ("Content_Hash"), so that the treatments don't read it again to know if it changed.
+    """
+    with h5py.File(filepath, 'w') as f:
+        f.attrs.update(attributes)
+        if data is not None:
+            raw_data = create_raw_dataset(f, dataset, data, **layout)
+            raw_data.attrs["Content_Hash"] = content_digest(np.asarray(data), raw_data.dtype)
+            f.attrs.update(layout_attributes(raw_data))
+        if others is not None:
+            for name, value in others.items():
+                f.create_dataset(name, data=value)
+    return filepath
+
+class BH5StreamWriter:
+    """Appends spectra to the raw data of a BH5 file while they are acquired.
+
+    The raw data has the shape map_shape + (nb_channels,) and is filled in acquisition order (last spatial axis
+    varying fastest). If map_shape[0] is None, the map grows along its first axis for as long as spectra arrive.
+    The dataset is resized one line of the first axis at a time, so readers always see the lines started so far.
+    Only the spectra waiting to be written are kept in memory. With swmr=True, other processes can open the file
+    with h5py.File(filepath, 'r', libver='latest', swmr=True) and call refresh() on the dataset to follow the run.
+    """
+    def __init__(self, filepath, attributes, map_shape, nb_channels, dataset="Data/Raw_data", others=None,
+                 dtype="uint32", compression=None, compression_opts=None, shuffle=False,
+                 flush_every=1000, flush_interval=5., swmr=True):
+        self.map_shape = tuple(map_shape)
+        self.nb_channels = int(nb_channels)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.nb_spectra = 0
+        self.nb_written = 0
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+        # Number of spectra in one line of the first axis
+        self.line_size = int(np.prod(self.map_shape[1:], dtype=np.int64))
+
+        shape = (0 if self.map_shape[0] is None else 1,) + self.map_shape[1:] + (self.nb_channels,)
+        maxshape = (None,)*len(self.map_shape) + (self.nb_channels,)
+        chunks = spectrum_chunks((1,) + self.map_shape[1:] + (self.nb_channels,), dtype)
+
+        self.file = h5py.File(filepath, 'w', libver='latest')
+        try:
+            self.file.attrs.update(attributes)
+            self.raw_data = self.file.create_dataset(dataset, shape=shape, maxshape=maxshape, dtype=dtype, chunks=chunks,
+                                                     compression=compression, compression_opts=compression_opts,
+                                                     shuffle=shuffle)
+            self.file.attrs.update(layout_attributes(self.raw_data))
+            if others is not None:
+                for name, value in others.items():
+                    self.file.create_dataset(name, data=value)
+
+            # No attribute or dataset can be created once SWMR mode is on
+            if swmr: self.file.swmr_mode = True
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, spectra):
+        """Appends one spectrum or an array of spectra (last axis: spectral channels) to the map."""
+        spectra = np.asarray(spectra).reshape(-1, self.nb_channels)
+        if self.map_shape[0] is not None and self.nb_spectra + spectra.shape[0] > self.map_shape[0]*self.line_size:
+            raise ValueError(f"The map of shape {self.map_shape} can't hold more than {self.map_shape[0]*self.line_size} spectra")
+
+        self.buffer.append(spectra)
+        self.nb_spectra += spectra.shape[0]
+        if self.nb_spectra - self.nb_written >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the spectra waiting in memory and makes them visible to the readers."""
+        if self.buffer:
+            spectra = np.concatenate(self.buffer)
+            self.buffer = []
+
+            # Extend the map to the line of the last spectrum
+            nb_lines = -(-self.nb_spectra//self.line_size)
+            if self.raw_data.shape[0] < nb_lines:
+                self.raw_data.resize(nb_lines, axis=0)
+
+            # Write the spectra one line of the last spatial axis at a time
+            position = self.nb_written
+            while spectra.shape[0]:
+                index = np.unravel_index(position, (self.raw_data.shape[0],) + self.map_shape[1:])
+                nb = min(spectra.shape[0], self.map_shape[-1] - index[-1]) if len(self.map_shape) > 1 else spectra.shape[0]
+                self.raw_data[tuple(index[:-1]) + (slice(index[-1], index[-1] + nb),)] = spectra[:nb]
+                spectra = spectra[nb:]
+                position += nb
+            self.nb_written = position
+
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Writes the remaining spectra and closes the file."""
+        if self.file:
+            self.flush()
+            self.file.close()
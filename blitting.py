@@ -0,0 +1,35 @@
+# Lines updated many times per second (previews following a spinbox) are drawn with blitting: the rest of the axes is
+# rendered once and cached, and each update only restores this background and draws the line again.
+
+class BlitLine:
+    """Line drawn over the cached background of its axes, updated without redrawing the rest of the figure."""
+    def __init__(self, ax, x, y, *args, **kwargs):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.line, = ax.plot(x, y, *args, animated = True, **kwargs)
+        self.background = None
+        # A full draw of the figure (first display, resize, zoom) renders the background again
+        self.cid = self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        if self.line.axes is not self.ax:
+            # The line was removed, for example by clearing the axes
+            self.canvas.mpl_disconnect(self.cid)
+            return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def set_data(self, x, y):
+        """Changes the points of the line and draws it over the cached background."""
+        self.line.set_data(x, y)
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def remove(self):
+        self.canvas.mpl_disconnect(self.cid)
+        if self.line.axes is not None: self.line.remove()
+        self.background = None
@@ -0,0 +1,115 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from ghost_parser import read_ghost_file, ghost_attributes
+from bh5_writer import write_bh5
+
+supported_extensions = [".dat", ".tif"]
+
+def convert_raw_file(filepath, bh5_directory, layout=None):
+    """Converts a raw file to a BH5 file and returns the (name, data_shape, bh5_filepath, kwargs) entry of the database."""
+    name, ext = os.path.splitext(os.path.basename(filepath))
+    timestmp = time.ctime(os.path.getctime(filepath))
+    bh5_filepath = bh5_directory+"/"+name+".bh5"
+
+    if ext.lower() == ".dat":
+        metadata, data = read_ghost_file(filepath)
+        attributes = ghost_attributes(name, metadata, data)
+        kwargs = {"date": timestmp,
+                  "sample": metadata["Sample"],
+                  "brillouin_signal_type": "spontaneous",
+                  "scanning_strategy": "point_scanning",
+                  "spectrometer_type": "FP",
+                  "laser_wavelength": int(metadata["Wavelength"]),
+                  "scan_amplitude": float(metadata["Scan amplitude"])}
+    elif ext.lower() == ".tif":
+        from PIL import Image
+        data = np.array(Image.open(filepath))
+        attributes = {'FILEPROP.BLS_HDF5_Version': '0.1',
+                      'FILEPROP.Name': name,
+                      'SPECTROMETER.Illumination_Type': "CW"}
+        kwargs = {"date": timestmp}
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
+    attributes['MEASURE.Date_of_measure'] = timestmp
+
+    # Write the data and the attributes while the file is open
+    write_bh5(bh5_filepath, data, attributes, **(layout or {}))
+
+    return (name, data.shape, bh5_filepath, kwargs)
+
+def _convert_safely(args):
+    """Wraps convert_raw_file so that a failing file doesn't stop the pool."""
+    filepath, bh5_directory, layout = args
+    try:
+        return filepath, convert_raw_file(filepath, bh5_directory, layout), None
+    except Exception as e:
+        return filepath, None, f"{type(e).__name__}: {e}"
+
+class BulkImporter:
+    def __init__(self, db_manager, max_workers=None, layout=None):
+        self.db_manager = db_manager
+        self.max_workers = max_workers
+        self.layout = layout
+        self.cancelled = False
+        self.bh5_directory = os.path.dirname(os.path.abspath(self.db_manager.db_path))+"/BH5_files"
+
+    def cancel(self):
+        """Stops the import: remaining files are skipped and the files already converted are added to the database."""
+        self.cancelled = True
+
+    def run(self, filepaths, progress=None, failure=None):
+        """Converts the files in a process pool and adds them to the database in a single transaction.
+
+        progress(done, total) is called after each file and failure(filepath, message) for each file that couldn't be imported.
+        Returns the list of entries added to the database and the list of (filepath, message) failures.
+        """
+        failures = []
+        def fail(filepath, message):
+            failures.append((filepath, message))
+            if failure is not None: failure(filepath, message)
+
+        os.makedirs(self.bh5_directory, exist_ok=True)
+
+        # Sort out the files that can't be imported before starting the pool
+        names_in_db = self.db_manager.names_in_db(os.path.splitext(os.path.basename(e))[0] for e in filepaths)
+        to_convert = []
+        names = set()
+        for filepath in filepaths:
+            name, ext = os.path.splitext(os.path.basename(filepath))
+            if ext.lower() == ".bh5":
+                # Importing BH5 files is planned, they are not reported as an unknown format
+                fail(filepath, "Adding BH5 files to the database is not implemented yet")
+            elif ext.lower() not in supported_extensions:
+                fail(filepath, f"Unsupported file format: {ext}")
+            elif name in names_in_db or name in names:
+                fail(filepath, "The database has already a file with identical name")
+            else:
+                names.add(name)
+                to_convert.append((filepath, self.bh5_directory, self.layout))
+
+        total = len(filepaths)
+        done = total - len(to_convert)
+        if progress is not None: progress(done, total)
+
+        spectra = []
+        if to_convert:
+            workers = self.max_workers or os.cpu_count() or 1
+            chunksize = max(1, min(64, len(to_convert)//(4*workers)))
+            # Spawned workers don't inherit the threads of the GUI (Qt, HDF5) of the calling process
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                for filepath, entry, error in executor.map(_convert_safely, to_convert, chunksize=chunksize):
+                    if error is None: spectra.append(entry)
+                    else: fail(filepath, error)
+                    done += 1
+                    if progress is not None: progress(done, total)
+                    if self.cancelled: break
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        # Single writer: all the rows are committed at once
+        if spectra: self.db_manager.add_spectra(spectra)
+        return spectra, failures
@@ -0,0 +1,89 @@
+import hashlib
+import h5py
+import numpy as np
+from collections import OrderedDict
+
+# The channels of VIPA and camera spectrometers aren't evenly spaced in frequency: their frequency axis is given by a
+# calibration stored with the raw data, either the "Calibration_Curve" dataset or the "Abscissa" dataset. The mapping
+# of the channels to the frequencies is built once for each calibration, and its axis once for each number of
+# channels, so that all the files sharing a calibration share the same axis. Only the last max_cached_calibrations
+# mappings and axes used are kept.
+
+# Degree of the polynomial fitted to the (channel, frequency) points of a calibration curve
+calibration_degree = 2
+
+# Channel to frequency mappings and their axes, by hash of the calibration they were built from, the least recently
+# used first
+interpolators = OrderedDict()
+axes = OrderedDict()
+max_cached_calibrations = 16
+
+def read_calibration(f):
+    """Returns the name and the content of the calibration of an open BH5 file, searched in the "Data" group then at
+    its root. Returns None if the file has none."""
+    for name in ("Calibration_Curve", "Abscissa"):
+        for group in (f["Data"], f):
+            if name in group and isinstance(group[name], h5py.Dataset): return name, group[name][...]
+    return None
+
+def calibration_points(curve):
+    """Returns the (channels, frequencies) points of a calibration curve stored as two columns or two lines, None for a
+    curve giving the frequency of each channel."""
+    curve = np.asarray(curve, dtype=float)
+    if curve.ndim != 2 or 2 not in curve.shape or curve.size <= 2: return None
+    if curve.shape[1] != 2: curve = curve.T
+    order = np.argsort(curve[:, 0])
+    return curve[order, 0], curve[order, 1]
+
+def calibration_hash(name, curve, degree=calibration_degree):
+    """Returns the hash identifying the mapping built from a calibration."""
+    points = calibration_points(curve) if name == "Calibration_Curve" else None
+    # The points of a curve are hashed in the same order whether they are stored as columns or as lines
+    curve = np.ascontiguousarray(np.column_stack(points) if points is not None else curve, dtype=float)
+    h = hashlib.sha1(str((name, curve.shape, degree)).encode())
+    h.update(curve.tobytes())
+    return h.hexdigest()
+
+def build_interpolator(name, curve, degree=calibration_degree):
+    """Returns the function mapping channels (fractional or not, of any shape) to frequencies given by a calibration.
+
+    Calibration curves of (channel, frequency) points are fitted by a polynomial of the given degree, or of lower
+    degree when there are fewer points. Abscissas and curves holding the frequency of each channel are interpolated
+    linearly between channels.
+    """
+    points = calibration_points(curve) if name == "Calibration_Curve" else None
+    if points is not None:
+        channels, frequencies = points
+        if channels.size < 2: raise ValueError("A calibration curve needs at least two points")
+        return np.polynomial.Polynomial.fit(channels, frequencies, min(degree, channels.size - 1))
+    table = np.asarray(curve, dtype=float).ravel()
+    channels = np.arange(table.size)
+    return lambda x: np.interp(x, channels, table)
+
+def channel_interpolator(name, curve, degree=calibration_degree):
+    """Returns the mapping of the channels to the frequencies of a calibration and its hash, built once per calibration."""
+    digest = calibration_hash(name, curve, degree)
+    if digest not in interpolators: interpolators[digest] = build_interpolator(name, curve, degree)
+    interpolators.move_to_end(digest)
+    if len(interpolators) > max_cached_calibrations: interpolators.popitem(last=False)
+    return interpolators[digest], digest
+
+def calibrated_axis(f, nb_channels):
+    """Returns the frequency axis of nb_channels channels given by the calibration of an open BH5 file and the hash of
+    the calibration, None if the file has no calibration. The axis is shared by all the files of the same calibration."""
+    calibration = read_calibration(f)
+    if calibration is None: return None
+    name, curve = calibration
+    interpolator, digest = channel_interpolator(name, curve)
+    if name != "Calibration_Curve" or calibration_points(curve) is None:
+        # The frequency of each channel is given
+        if np.size(curve) != nb_channels:
+            raise ValueError(f"The {name} dataset has {np.size(curve)} points for {nb_channels} channels")
+    if (digest, nb_channels) not in axes:
+        axis = interpolator(np.arange(nb_channels, dtype=float))
+        # The shared axis isn't modified by the treatments
+        axis.setflags(write=False)
+        axes[(digest, nb_channels)] = axis
+    axes.move_to_end((digest, nb_channels))
+    if len(axes) > max_cached_calibrations: axes.popitem(last=False)
+    return axes[(digest, nb_channels)], digest
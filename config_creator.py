@@ -43,27 +43,58 @@ def create_config():
                  ["brillouin_signal_type","TEXT"],
                  ["scanning_strategy","TEXT"],
                  ["spectrometer_type","TEXT"],
-                 ["acquisition_time","TEXT"],
-                 ["laser_wavelength","TEXT"],
+                 ["acquisition_time","REAL"],
+                 ["laser_wavelength","REAL"],
                  ["laser_model","TEXT"],
-                 ["laser_power","TEXT"],
-                 ["lens_NA","TEXT"],
-                 ["scattering_angle","TEXT"],
+                 ["laser_power","REAL"],
+                 ["lens_NA","REAL"],
+                 ["scattering_angle","REAL"],
                  ["immersion_medium","TEXT"],
                  ["objective_model","TEXT"],
-                 ["temperature","TEXT"],
-                 ["temperature_uncertainty","TEXT"],
+                 ["temperature","REAL"],
+                 ["temperature_uncertainty","REAL"],
                  ["data_shape","TEXT"],
-                 ["spatial_resolution","TEXT"],
+                 ["spatial_resolution","REAL"],
                  ["abscissa_type","TEXT"],
                  ["info","TEXT"],
                  ["spectro_caracterization","TEXT"],
-                 ["tfp_range","TXT"]
+                 ["tfp_range","REAL"],
+                 ["nb_spectra","INTEGER"],
+                 ["nb_channels","INTEGER"],
+                 ["bh5_mtime","REAL"]
                  ]
 
     display_column = [["name","name"],
                       ["date","date"],
                       ["sample","sample"]]
+
+    # Define the columns that are indexed in the database to filter the spectra
+    filterable_columns = [["sample","sample"],
+                          ["date","date"],
+                          ["brillouin_signal_type","brillouin_signal_type"],
+                          ["scanning_strategy","scanning_strategy"],
+                          ["spectrometer_type","spectrometer_type"],
+                          ["laser_wavelength","laser_wavelength"]]
+
+    # Define the attributes of the BH5 files copied to the columns of the database
+    attribute_columns = [["sample","MEASURE.Sample"],
+                         ["date","MEASURE.Date_of_measure"],
+                         ["acquisition_time","MEASURE.Exposure"],
+                         ["scanning_strategy","SPECTROMETER.Scanning_Strategy"],
+                         ["spectrometer_type","SPECTROMETER.Type"],
+                         ["laser_wavelength","SPECTROMETER.Wavelength_nm"],
+                         ["laser_model","SPECTROMETER.Laser_Model"],
+                         ["laser_power","SPECTROMETER.Illumination_Power"],
+                         ["lens_na","SPECTROMETER.Detection_Lens_NA"],
+                         ["scattering_angle","SPECTROMETER.Scattering_Angle"],
+                         ["data_shape","MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)"]]
+
+    # Define the storage layout of the raw data in the BH5 files
+    bh5_layout = [["dtype","auto"],
+                  ["compression","gzip"],
+                  ["compression_opts","4"],
+                  ["shuffle","True"],
+                  ["chunks","spectra"]]
     
     # Add properties to the configuration
     config['Version'] = {"brillouin_bh5": "v0.1"}
@@ -73,6 +104,12 @@ def create_config():
     for e in db_colums: config['Database Columns'][e[0]] = e[1]
     config['Columns at opening'] = {}
     for e in display_column: config['Columns at opening'][e[0]] = e[1]
+    config['Filterable Columns'] = {}
+    for e in filterable_columns: config['Filterable Columns'][e[0]] = e[1]
+    config['Attribute Columns'] = {}
+    for e in attribute_columns: config['Attribute Columns'][e[0]] = e[1]
+    config['BH5 Layout'] = {}
+    for e in bh5_layout: config['BH5 Layout'][e[0]] = e[1]
 
     # Write the configuration to a file
     with open(config_path, 'w') as configfile:
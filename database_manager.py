@@ -0,0 +1,389 @@
+import ast
+import math
+import sqlite3
+import threading
+import numpy as np
+
+def column_type(declaration):
+    """Returns the Python type (int, float or str) of the values of a column from its SQL declaration."""
+    declaration = declaration.upper()
+    if "INT" in declaration: return int
+    if any(e in declaration for e in ("REAL", "FLOA", "DOUB", "NUM")): return float
+    return str
+
+def typed_value(value, python_type):
+    """Converts a value to the type of its column. Values that aren't numbers are stored as NULL in numeric columns."""
+    if python_type is str or value is None: return value
+    try:
+        return python_type(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+class DatabaseManager:
+    # Pragmas applied to every connection. With WAL, the interface can read the table while spectra are written.
+    pragmas = {"journal_mode": "WAL",
+               "synchronous": "NORMAL",
+               "cache_size": -64000,     # 64 MB
+               "mmap_size": 268435456,   # 256 MB
+               "temp_store": "MEMORY"}
+
+    # Version of the schema, stored in the user_version of the database file
+    schema_version = 3
+
+    # Columns of the table mirroring the fits stored in the BH5 files: one row per fitted spectrum of a file and fit model
+    results_columns = {"spectrum_id": "INTEGER",
+                       "model": "TEXT",
+                       "point": "INTEGER",       # index of the spectrum in the flattened map
+                       "shift": "REAL",
+                       "shift_uncertainty": "REAL",
+                       "linewidth": "REAL",
+                       "linewidth_uncertainty": "REAL",
+                       "amplitude": "REAL",
+                       "amplitude_uncertainty": "REAL",
+                       "offset": "REAL",
+                       "converged": "INTEGER",
+                       "step_hash": "TEXT"}
+
+    def __init__(self, db_path, config):
+        self.db_path = db_path
+        self.config = config
+        self.connections = {}   # connection of each thread, kept open until close()
+        self.lock = threading.Lock()
+
+    def create_table(self):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(self.create_table_cmd("spectra"))
+            conn.commit()
+        self.migrate()
+
+    def create_table_cmd(self, table):
+        """Returns the command creating a table with all the columns of the configuration file."""
+        cmd = f"CREATE TABLE IF NOT EXISTS {table} ("
+        for e in self.config["Database Columns"]:
+            cmd = cmd + e + " " + self.config["Database Columns"][e] + ","
+        return cmd[:-1] + ")"
+
+    def column_types(self):
+        """Returns the Python type of the values of each column of the configuration file, by lower case name."""
+        return {e.lower(): column_type(self.config["Database Columns"][e]) for e in self.config["Database Columns"]}
+
+    def connect(self, compatibility = False):
+        """Returns the connection of the calling thread, opened on first use. With compatibility, the database is migrated to the current schema."""
+        thread = threading.get_ident()
+        with self.lock:
+            conn = self.connections.get(thread)
+            if conn is None:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                for pragma, value in self.pragmas.items():
+                    conn.execute(f"PRAGMA {pragma} = {value}")
+                self.connections[thread] = conn
+        if compatibility: self.migrate()
+        return conn
+
+    def close(self):
+        """Closes the connections of all the threads."""
+        with self.lock:
+            for conn in self.connections.values():
+                conn.close()
+            self.connections = {}
+
+    def close_thread_connection(self):
+        """Closes the connection of the calling thread, to be called by worker threads when they finish."""
+        with self.lock:
+            conn = self.connections.pop(threading.get_ident(), None)
+        if conn is not None: conn.close()
+
+    def migrate(self):
+        """Adds the columns of the configuration file missing from the database and creates the indexes."""
+        conn = self.connect()
+        cursor = conn.cursor()
+
+        # Fetch the column names and types of the spectra table
+        cursor.execute("PRAGMA table_info(spectra)")
+        column_db = {column[1].lower(): column_type(column[2]) for column in cursor.fetchall()}
+
+        # If the configuration has new columns, we alter the db to add them
+        for e in self.config["Database Columns"]:
+            if e.lower() not in column_db:
+                cursor.execute(f"ALTER TABLE spectra ADD COLUMN {e} {self.config['Database Columns'][e]}")
+                column_db[e.lower()] = column_type(self.config["Database Columns"][e])
+
+        # Numeric columns were declared as text before the version 2 of the schema
+        if any(column_db[column] != python_type for column, python_type in self.column_types().items()):
+            self.retype(conn)
+
+        self.create_indexes(cursor)
+        cursor.execute("CREATE TABLE IF NOT EXISTS fit_results (" + ", ".join(f"{e} {t}" for e, t in self.results_columns.items())
+                       + ", PRIMARY KEY (spectrum_id, model, point)) WITHOUT ROWID")
+        cursor.execute(f"PRAGMA user_version = {self.schema_version}")
+        conn.commit()
+
+    def retype(self, conn):
+        """Rebuilds the spectra table with the column types of the configuration file, converting the stored values."""
+        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        columns = [e for e in self.config["Database Columns"]]
+        types = self.column_types()
+        cursor.execute(self.create_table_cmd("spectra_typed"))
+        rows = []
+        for row in cursor.execute(f"SELECT {', '.join(columns)} FROM spectra").fetchall():
+            values = {column.lower(): typed_value(value, types[column.lower()]) for column, value in zip(columns, row)}
+            # Size of the data of the spectra imported before the nb_spectra and nb_channels columns
+            if values.get("nb_channels") is None and "nb_channels" in values:
+                values["nb_spectra"], values["nb_channels"] = self.data_size(values.get("data_shape"))
+            rows.append(tuple(values[column.lower()] for column in columns))
+        cursor.executemany(f"INSERT INTO spectra_typed ({', '.join(columns)}) VALUES ({', '.join('?'*len(columns))})", rows)
+        cursor.execute("DROP TABLE spectra")
+        cursor.execute("ALTER TABLE spectra_typed RENAME TO spectra")
+
+    @staticmethod
+    def data_size(data_shape):
+        """Returns the number of spectra and of channels of data of a given shape (a tuple or its text), None if unknown."""
+        try:
+            if isinstance(data_shape, str): data_shape = ast.literal_eval(data_shape)
+            data_shape = tuple(int(e) for e in data_shape)
+        except (ValueError, TypeError, SyntaxError):
+            return None, None
+        if not data_shape: return None, None
+        return math.prod(data_shape[:-1]), data_shape[-1]
+
+    def create_indexes(self, cursor):
+        """Creates the unique indexes on the names and filepaths and an index on each filterable column."""
+        for column in ("name", "filepath"):
+            try:
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_spectra_{column} ON spectra ({column})")
+            except sqlite3.IntegrityError:
+                # Databases created before the indexes may hold duplicates: the lookups are still indexed
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_spectra_{column} ON spectra ({column})")
+        if self.config.has_section("Filterable Columns"):
+            for column in self.config["Filterable Columns"]:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_spectra_{column} ON spectra ({column})")
+
+    def add_spectrum(self, name, data, bh5_filepath, **kwargs):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.insert_spectrum_cmd, self.spectrum_row(name, data.shape, bh5_filepath, **kwargs))
+            conn.commit()
+
+    def add_spectra(self, spectra):
+        """Adds a list of (name, data_shape, bh5_filepath, kwargs) spectra to the database in a single transaction."""
+        rows = [self.spectrum_row(name, data_shape, bh5_filepath, **kwargs) for (name, data_shape, bh5_filepath, kwargs) in spectra]
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(self.insert_spectrum_cmd, rows)
+            conn.commit()
+
+    insert_columns = ("name", "filepath", "date", "sample", "brillouin_signal_type", "scanning_strategy", "spectrometer_type", "laser_wavelength", "data_shape", "tfp_range", "nb_spectra", "nb_channels")
+    insert_spectrum_cmd = f"INSERT INTO spectra ({', '.join(insert_columns)}) VALUES ({', '.join('?'*len(insert_columns))})"
+
+    def spectrum_row(self, name, data_shape, bh5_filepath, **kwargs):
+        """Returns the values inserted in the database for a spectrum of a given shape."""
+        date = kwargs.get("date", "Not specified")
+        sample = kwargs.get('sample', "Not specified")
+        brillouin_signal_type = kwargs.get("brillouin_signal_type","Not specified")
+        scanning_strategy = kwargs.get("scanning_strategy", "Not specified")
+        spectrometer_type = kwargs.get("spectrometer_type", "Not specified")
+        laser_wavelength = typed_value(kwargs.get("laser_wavelength"), float)
+        scan_amplitude = typed_value(kwargs.get("scan_amplitude"), float)
+        acquisition_time = kwargs.get("acquisition_time", 0)
+        laser_model = kwargs.get("laser_model", "Not specified")
+        laser_power = kwargs.get("laser_power", 0)
+        lens_NA = kwargs.get("lens_NA", 0)
+        scattering_angle = kwargs.get("scattering_angle", 180)
+        immersion_medium = kwargs.get("immersion_medium", "Not specified")
+        objective_model = kwargs.get("objective_model", "Not specified")
+        temperature = kwargs.get("temperature", 0)
+        temperature_uncertainty = kwargs.get("temperature_uncertainty", 0)
+        information = kwargs.get("information", "")
+
+        nb_spectra, nb_channels = self.data_size(data_shape)
+
+        return (name, bh5_filepath, date, sample, brillouin_signal_type, scanning_strategy, spectrometer_type, laser_wavelength, str(tuple(data_shape)), scan_amplitude, nb_spectra, nb_channels)
+
+    def names_in_db(self, names):
+        """Returns the subset of the given names that are already in the database."""
+        names = list(names)
+        found = set()
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            # SQLite limits the number of parameters of a single query
+            for i in range(0, len(names), 500):
+                batch = names[i:i+500]
+                cursor.execute(f"SELECT name FROM spectra WHERE name IN ({','.join('?'*len(batch))})", batch)
+                found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def fetch_spectra(self):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM spectra")
+            return cursor.fetchall()
+
+    def spectra_by_ids(self, ids):
+        """Returns the spectra with the given ids, in the same order, with their columns in the order of the configuration file."""
+        ids = list(ids)
+        columns = [e for e in self.config["Database Columns"]]
+        id_index = columns.index("id")
+        spectra = {}
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            # SQLite limits the number of parameters of a single query
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i+500]
+                cursor.execute(f"SELECT {', '.join(columns)} FROM spectra WHERE id IN ({','.join('?'*len(batch))})", batch)
+                spectra.update((row[id_index], row) for row in cursor.fetchall())
+        return [spectra[e] for e in ids if e in spectra]
+
+    def check_columns(self, *columns, results=False):
+        """Raises a ValueError if a column isn't in the configuration file (or in the fit results table with results).
+
+        Column names are inserted in the SQL commands.
+        """
+        known = [e.lower() for e in self.config["Database Columns"]]
+        if results: known += list(self.results_columns)
+        for column in columns:
+            if column.lower() not in known: raise ValueError(f"Unknown database column: {column}")
+
+    def where_clause(self, filters, results=False):
+        """Returns the WHERE clause selecting the spectra matching the filters (column: condition) and its parameters.
+
+        A condition is a value, a (low, high) tuple for a range (None for an open bound) or a list of accepted values.
+        With results, the filters can also apply to the columns of the fit results table.
+        """
+        self.check_columns(*filters, results=results)
+        conditions, parameters = [], []
+        for column, value in filters.items():
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    conditions.append(f"{column} >= ?")
+                    parameters.append(low)
+                if high is not None:
+                    conditions.append(f"{column} <= ?")
+                    parameters.append(high)
+            elif isinstance(value, (list, set, frozenset)):
+                value = list(value)
+                conditions.append(f"{column} IN ({','.join('?'*len(value))})")
+                parameters += value
+            elif value is None:
+                conditions.append(f"{column} IS NULL")
+            else:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def query(self, columns=None, **filters):
+        """Returns the spectra matching the filters as dictionaries of the given columns (all by default), ordered by id.
+
+        For example query(["name", "temperature"], laser_wavelength=532, temperature=(20, 25)) returns the spectra
+        measured at 532 nm between 20 and 25 degrees. See where_clause for the filters.
+        """
+        columns = list(columns) if columns else [e for e in self.config["Database Columns"]]
+        self.check_columns(*columns)
+        where, parameters = self.where_clause(filters)
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM spectra{where} ORDER BY id", parameters).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def aggregate(self, column, by=None, **filters):
+        """Returns the count, mean, standard deviation, minimum and maximum of a numeric column, computed by SQLite.
+
+        The statistics are computed on the spectra matching the filters (see where_clause), for each value of the column
+        "by" and returned in a dictionary by value. Without "by", the dictionary has a single None key. The column can be
+        a fitted parameter, for example aggregate("shift", by="sample", model="DHO", converged=1).
+        """
+        results = any(e in self.results_columns for e in [column, by, *filters])
+        self.check_columns(column, *([by] if by else []), results=results)
+        where, parameters = self.where_clause(filters, results)
+        source = "spectra JOIN fit_results ON fit_results.spectrum_id = spectra.id" if results else "spectra"
+        selected = f"SELECT {by or 'NULL'} AS grp, {column} AS value FROM {source}{where}"
+        with self.connect() as conn:
+            # The squares are summed around the overall mean rather than around 0, so that they keep their precision
+            reference = conn.execute(f"SELECT AVG(value) FROM ({selected})", parameters).fetchone()[0] or 0
+            rows = conn.execute("SELECT grp, COUNT(value), AVG(value), SUM(value - ?), SUM((value - ?)*(value - ?)), MIN(value), MAX(value) "
+                                f"FROM ({selected}) GROUP BY grp", [reference]*3 + parameters).fetchall()
+        statistics = {}
+        for value, count, mean, deviations, squares, minimum, maximum in rows:
+            std = math.sqrt(max(squares - deviations*deviations/count, 0)/(count - 1)) if count > 1 else (0. if count else None)
+            statistics[value] = {"count": count, "mean": mean, "std": std, "min": minimum, "max": maximum}
+        return statistics
+
+    def fit_results(self, columns=("shift",), **filters):
+        """Returns a dictionary of arrays holding the given columns of the fit results of the spectra matching the filters.
+
+        Columns and filters can refer to the fit results table and to the spectra table, for example
+        fit_results(["shift", "sample"], model="DHO", converged=1, laser_wavelength=532).
+        """
+        columns = list(columns)
+        self.check_columns(*columns, results=True)
+        where, parameters = self.where_clause(filters, True)
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM fit_results JOIN spectra ON fit_results.spectrum_id = spectra.id{where}", parameters).fetchall()
+        values = list(zip(*rows)) if rows else [()]*len(columns)
+        types = {**{e: column_type(t) for e, t in self.results_columns.items()}, **self.column_types()}
+        return {column: np.array(value, dtype=float if types[column.lower()] is not str else object)
+                for column, value in zip(columns, values)}
+
+    def replace_fit_results(self, spectrum_ids, rows):
+        """Replaces the fit results of the given spectra by rows of values of the columns of the fit results table, in a single transaction."""
+        spectrum_ids = list(spectrum_ids)
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            # SQLite limits the number of parameters of a single query
+            for i in range(0, len(spectrum_ids), 500):
+                batch = spectrum_ids[i:i+500]
+                cursor.execute(f"DELETE FROM fit_results WHERE spectrum_id IN ({','.join('?'*len(batch))})", batch)
+            cursor.executemany(f"INSERT INTO fit_results ({', '.join(self.results_columns)}) VALUES ({', '.join('?'*len(self.results_columns))})", rows)
+            conn.commit()
+
+    def ids_by_filepath(self, filepaths):
+        """Returns the ids of the spectra stored in the given BH5 files, by filepath."""
+        filepaths = list(filepaths)
+        ids = {}
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(filepaths), 500):
+                batch = filepaths[i:i+500]
+                cursor.execute(f"SELECT filepath, id FROM spectra WHERE filepath IN ({','.join('?'*len(batch))})", batch)
+                ids.update(cursor.fetchall())
+        return ids
+
+    def filepaths(self, **filters):
+        """Returns the BH5 filepaths of the spectra matching the filters (see where_clause)."""
+        where, parameters = self.where_clause(filters)
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT filepath FROM spectra" + where, parameters)
+            return [row[0] for row in cursor.fetchall()]
+
+    def remove_spectrum(self, filepath):
+        """Remove a spectrum from the database by its filepath."""
+        try:
+            with self.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM fit_results WHERE spectrum_id IN (SELECT id FROM spectra WHERE filepath=?)", (filepath,))
+                cursor.execute("DELETE FROM spectra WHERE filepath=?", (filepath,))
+                conn.commit()
+        except sqlite3.Error as e:
+            raise sqlite3.Error(f"Failed to remove spectrum located at {filepath}: {e}")
+
+    def update_database_by_filepath(self, file_path, updates):
+        self.update_spectra({file_path: updates})
+
+    def update_spectra(self, updates):
+        """Updates the columns of several spectra, given as {filepath: {column: value}}, in a single transaction."""
+        self.check_columns(*{column for values in updates.values() for column in values})
+        types = self.column_types()
+        # Spectra updating the same columns share one command
+        commands = {}
+        for filepath, values in updates.items():
+            columns = tuple(values)
+            commands.setdefault(columns, []).append([typed_value(values[column], types[column.lower()]) for column in columns] + [filepath])
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            for columns, rows in commands.items():
+                if columns: cursor.executemany(f"UPDATE spectra SET {', '.join(f'{column} = ?' for column in columns)} WHERE filepath = ?", rows)
+            conn.commit()
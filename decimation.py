@@ -0,0 +1,122 @@
+import numpy as np
+
+# Lines and images are drawn at the resolution of the screen: lines are reduced to the minimum and maximum of the
+# points falling in each pixel column and images are drawn from a pyramid of downsampled frames. Both are computed
+# again for the visible part of the data when the limits of the axes change (zoom and pan of the navigation toolbar).
+
+def minmax_decimate(x, y, nb_bins):
+    """Returns the points of a line reduced to the minimum and the maximum of nb_bins bins of consecutive points.
+
+    The points of each bin are kept in their order, as well as the first and the last point of the line. The line is
+    returned unchanged when there is no bin, as for axes that aren't laid out yet.
+    """
+    if nb_bins < 1 or y.size <= 2*nb_bins + 2: return x, y
+    size = -(-y.size//nb_bins)
+    end = y.size//size*size
+    blocks = y[:end].reshape(-1, size)
+    i_min, i_max = np.argmin(blocks, axis=1), np.argmax(blocks, axis=1)
+    offsets = np.arange(0, end, size)
+    indices = [[0], np.column_stack((offsets + np.minimum(i_min, i_max), offsets + np.maximum(i_min, i_max))).ravel()]
+    if end < y.size:
+        tail = y[end:]
+        indices.append(end + np.sort([np.argmin(tail), np.argmax(tail)]))
+    indices.append([y.size - 1])
+    indices = np.concatenate(indices)
+    return x[indices], y[indices]
+
+def visible_range(x, xlim):
+    """Returns the start and stop indices of the points of a monotonic axis within the limits, with one point of margin."""
+    low, high = min(xlim), max(xlim)
+    if x.size > 1 and x[-1] < x[0]:
+        start = x.size - np.searchsorted(x[::-1], high, side="right")
+        stop = x.size - np.searchsorted(x[::-1], low, side="left")
+    else:
+        start = np.searchsorted(x, low, side="left")
+        stop = np.searchsorted(x, high, side="right")
+    return max(0, start - 1), min(x.size, stop + 1)
+
+class ImagePyramid:
+    """Frame downsampled by successive factors of 2 (mean of 2x2 blocks), each level being computed when first needed."""
+    def __init__(self, image, min_size=64):
+        self.levels = [np.asarray(image)]
+        self.min_size = min_size
+
+    def level(self, index):
+        while len(self.levels) <= index and min(self.levels[-1].shape[:2]) > self.min_size:
+            image = self.levels[-1].astype(np.float32)
+            # Odd frames are completed by repeating their last line or column
+            pad = [(0, image.shape[0] % 2), (0, image.shape[1] % 2)] + [(0, 0)]*(image.ndim - 2)
+            if any(e[1] for e in pad): image = np.pad(image, pad, mode="edge")
+            image = image.reshape(image.shape[0]//2, 2, image.shape[1]//2, 2, *image.shape[2:]).mean(axis=(1, 3))
+            self.levels.append(image)
+        return min(index, len(self.levels) - 1)
+
+    def view(self, xlim, ylim, width, height):
+        """Returns the level of the visible part of the frame closest to the given size in pixels and its extent."""
+        nb_rows, nb_columns = self.levels[0].shape[:2]
+        columns = (max(0, int(np.floor(min(xlim) + .5))), min(nb_columns, int(np.ceil(max(xlim) + .5))))
+        rows = (max(0, int(np.floor(min(ylim) + .5))), min(nb_rows, int(np.ceil(max(ylim) + .5))))
+        ratio = max((columns[1] - columns[0])/max(width, 1), (rows[1] - rows[0])/max(height, 1), 1)
+        index = self.level(int(np.log2(ratio)))
+        factor = 2**index
+        c0, c1 = columns[0]//factor, -(-columns[1]//factor)
+        r0, r1 = rows[0]//factor, -(-rows[1]//factor)
+        image = self.levels[index][r0:max(r1, r0 + 1), c0:max(c1, c0 + 1)]
+        extent = (c0*factor - .5, min(c0*factor + image.shape[1]*factor, nb_columns) - .5,
+                  min(r0*factor + image.shape[0]*factor, nb_rows) - .5, r0*factor - .5)
+        return image, extent
+
+def refresh(ax, lines=True):
+    """Decimates again the images of the axes, and their lines unless lines is False, for their current limits."""
+    # Changing the extent of an image can change the limits, which calls refresh again
+    if getattr(ax, "decimating", False): return
+    ax.decimating = True
+    try:
+        update(ax, lines)
+    finally:
+        ax.decimating = False
+
+def update(ax, lines=True):
+    width, height = ax.bbox.width, ax.bbox.height
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    for line in ax.lines:
+        if not lines or not hasattr(line, "full_data"): continue
+        x, y = line.full_data
+        start, stop = visible_range(x, xlim) if line.monotonic else (0, x.size)
+        line.set_data(*minmax_decimate(x[start:stop], y[start:stop], int(width)))
+    for image in ax.images:
+        if not hasattr(image, "pyramid"): continue
+        data, extent = image.pyramid.view(xlim, ylim, width, height)
+        image.set_data(data)
+        image.set_extent(extent)
+        # set_extent changes the limits of the axes when they are autoscaled
+        ax.set_xlim(xlim, emit=False)
+        ax.set_ylim(ylim, emit=False)
+
+def connect(ax):
+    """Decimates the data of the axes again when their limits change. Clearing the axes removes the connection."""
+    if getattr(ax.callbacks, "decimation", False): return
+    ax.callbacks.connect("xlim_changed", refresh)
+    # The points of a line only depend on the horizontal limits
+    ax.callbacks.connect("ylim_changed", lambda ax: refresh(ax, lines=False))
+    ax.callbacks.decimation = True
+
+def plot_decimated(ax, x, y, *args, **kwargs):
+    """Plots a line like ax.plot, reduced to the resolution of the axes. Returns the line."""
+    x, y = np.asarray(x).ravel(), np.asarray(y).ravel()
+    line, = ax.plot(*minmax_decimate(x, y, int(ax.bbox.width)), *args, **kwargs)
+    line.full_data = (x, y)
+    steps = np.diff(x)
+    line.monotonic = bool(np.all(steps >= 0) or np.all(steps <= 0))
+    connect(ax)
+    return line
+
+def imshow_pyramid(ax, image, **kwargs):
+    """Displays a frame like ax.imshow, from the level of its pyramid matching the resolution of the axes. Returns the image."""
+    pyramid = ImagePyramid(image)
+    nb_rows, nb_columns = pyramid.levels[0].shape[:2]
+    data, extent = pyramid.view((-.5, nb_columns - .5), (-.5, nb_rows - .5), ax.bbox.width, ax.bbox.height)
+    artist = ax.imshow(data, extent=extent, **kwargs)
+    artist.pyramid = pyramid
+    connect(ax)
+    return artist
@@ -0,0 +1,92 @@
+import h5py
+import numpy as np
+from collections import OrderedDict
+from treatment import write_treated_dataset
+
+# Impulse responses and their transforms, by file and spectral length, the least recently used first
+kernel_cache = OrderedDict()
+max_cached_kernels = 16
+
+def read_impulse_response(f):
+    """Returns the impulse response stored in an open BH5 file, in the "Data" group or at its root."""
+    if "Impulse_Response" in f["Data"]:
+        return f["Data"]["Impulse_Response"][...]
+    if "Impulse_Response" in f:
+        return f["Impulse_Response"][...]
+    raise ValueError("No impulse response is stored in the file")
+
+def store_impulse_response(filepath, impulse_response):
+    """Stores an impulse response in the "Data" group of a BH5 file, replacing the previous one."""
+    with h5py.File(filepath, 'a') as f:
+        if "Impulse_Response" in f["Data"]: del f["Data"]["Impulse_Response"]
+        f["Data"].create_dataset("Impulse_Response", data=np.asarray(impulse_response, dtype=float).ravel())
+
+def impulse_response_kernel(impulse_response, nb_channels, filepath=None):
+    """Returns the real FFT of the impulse response normalized to unit area and centered on its maximum.
+
+    The kernels of the last max_cached_kernels files and spectral lengths are cached, and recomputed if the stored
+    impulse response changed.
+    """
+    impulse_response = np.asarray(impulse_response, dtype=float).ravel()
+    key = (filepath, nb_channels)
+    if key in kernel_cache and np.array_equal(kernel_cache[key][0], impulse_response):
+        kernel_cache.move_to_end(key)
+        return kernel_cache[key][1]
+    stored = impulse_response
+
+    # Keep at most one spectrum length of impulse response around its maximum
+    center = int(np.argmax(impulse_response))
+    start = max(0, center - nb_channels//2)
+    impulse_response = impulse_response[start:start + nb_channels]
+    center = center - start
+
+    padded = np.zeros(nb_channels)
+    padded[:impulse_response.size] = impulse_response/np.sum(impulse_response)
+    kernel = np.fft.rfft(np.roll(padded, -center))
+
+    if filepath is not None:
+        kernel_cache[key] = (stored, kernel)
+        kernel_cache.move_to_end(key)
+        if len(kernel_cache) > max_cached_kernels: kernel_cache.popitem(last=False)
+    return kernel
+
+def wiener_deconvolve(spectra, kernel, regularization=1e-2):
+    """Deconvolves all the spectra (last axis) at once with a Wiener filter.
+
+    regularization is the noise to signal power ratio, relative to the maximum power of the kernel.
+    """
+    power = np.abs(kernel)**2
+    wiener = np.conj(kernel)/(power + regularization*np.max(power))
+    return np.fft.irfft(np.fft.rfft(spectra, axis=-1)*wiener, n=spectra.shape[-1], axis=-1)
+
+def richardson_lucy(spectra, kernel, iterations=30):
+    """Deconvolves all the spectra (last axis) at once with the Richardson-Lucy algorithm."""
+    n = spectra.shape[-1]
+    spectra = np.maximum(spectra, 0)
+    estimate = np.full_like(spectra, 1.)*np.mean(spectra, axis=-1, keepdims=True)
+    for _ in range(iterations):
+        convolved = np.fft.irfft(np.fft.rfft(estimate, axis=-1)*kernel, n=n, axis=-1)
+        ratio = spectra/np.maximum(convolved, 1e-12)
+        estimate *= np.fft.irfft(np.fft.rfft(ratio, axis=-1)*np.conj(kernel), n=n, axis=-1)
+        np.maximum(estimate, 0, out=estimate)
+    return estimate
+
+def deconvolve(spectra, kernel, method="Wiener", batch_size=4096, **kwargs):
+    """Deconvolves a stack of spectra (last axis) by batches of spectra with the "Wiener" or "Richardson-Lucy" method."""
+    spectra = np.asarray(spectra, dtype=float)
+    shape = spectra.shape
+    spectra = spectra.reshape(-1, shape[-1])
+    function = {"Wiener": wiener_deconvolve, "Richardson-Lucy": richardson_lucy}[method]
+    result = np.empty_like(spectra)
+    for start in range(0, spectra.shape[0], batch_size):
+        result[start:start + batch_size] = function(spectra[start:start + batch_size], kernel, **kwargs)
+    return result.reshape(shape)
+
+def deconvolve_bh5(filepath, parent="Raw_data", method="Wiener", **kwargs):
+    """Deconvolves a dataset of the "Data" group by the impulse response of the file and stores it in "Deconvolved"."""
+    with h5py.File(filepath, 'a') as f:
+        spectra = f["Data"][parent][...]
+        kernel = impulse_response_kernel(read_impulse_response(f), spectra.shape[-1], filepath)
+        result = deconvolve(spectra, kernel, method, **kwargs)
+        write_treated_dataset(f["Data"], "Deconvolved", result, parent, Method=method, **kwargs)
+    return result
@@ -0,0 +1,33 @@
+import h5py
+
+# Datasets of the fit groups of the BH5 files mirrored in the fit results table of the database, by column
+mirrored_datasets = {"shift": "Shift",
+                     "shift_uncertainty": "Shift_Uncertainty",
+                     "linewidth": "Linewidth",
+                     "linewidth_uncertainty": "Linewidth_Uncertainty",
+                     "amplitude": "Amplitude",
+                     "amplitude_uncertainty": "Amplitude_Uncertainty",
+                     "offset": "Offset",
+                     "converged": "Converged"}
+
+def fit_result_rows(f, spectrum_id):
+    """Returns the rows of the fit results table for the fits stored in an open BH5 file, one per fitted spectrum."""
+    rows = []
+    for group in f["Data"].values():
+        if not isinstance(group, h5py.Group) or "Fit_Model" not in group.attrs: continue
+        columns = [group[dataset][...].ravel().tolist() if dataset in group else None for dataset in mirrored_datasets.values()]
+        size = max(len(e) for e in columns if e is not None)
+        columns = [e if e is not None else [None]*size for e in columns]
+        model, step_hash = group.attrs["Fit_Model"], group.attrs.get("Step_Hash")
+        rows += [(spectrum_id, model, point, *values, step_hash) for point, values in enumerate(zip(*columns))]
+    return rows
+
+def store_fit_results(db_manager, filepaths):
+    """Mirrors the fits stored in BH5 files of a database in its fit results table. Returns the number of rows written."""
+    ids = db_manager.ids_by_filepath(filepaths)
+    rows = []
+    for filepath, spectrum_id in ids.items():
+        with h5py.File(filepath, 'r') as f:
+            rows += fit_result_rows(f, spectrum_id)
+    db_manager.replace_fit_results(ids.values(), rows)
+    return len(rows)
@@ -0,0 +1,303 @@
+import h5py
+import numpy as np
+from treatment import frequency_axis, write_treated_group
+
+def lorentzian(x, center, width, amplitude):
+    """Returns a Lorentzian of given full width at half maximum and its derivatives with respect to amplitude, center and width."""
+    scale = 2/width
+    u = x - center
+    u *= scale
+    u2 = u*u
+    d = u2 + 1
+    np.reciprocal(d, out=d)
+    value = amplitude*d
+    d_center = value*d
+    d_width = d_center*u2
+    d_width *= scale
+    d_center *= u
+    d_center *= 2*scale
+    return value, d, d_center, d_width
+
+class LorentzianDoublet:
+    """Stokes and anti-Stokes Lorentzian peaks at center -/+ shift on a constant offset.
+
+    Without elastic compensation, the doublet is centered on 0. With it, the center of the doublet is fitted to
+    follow the drift of the elastic peak, and the tail of the elastic peak under the doublet is modelled by
+    Elastic_Tail/(x - center)^2. In both cases the elastic peak itself is excluded from the fit.
+    """
+    name = "Lorentzian"
+
+    def __init__(self, elastic_compensation=False):
+        self.elastic_compensation = elastic_compensation
+        self.parameters = ["Shift", "Linewidth", "Amplitude", "Offset"]
+        if elastic_compensation: self.parameters = self.parameters + ["Center", "Elastic_Tail"]
+
+    def peak(self, x, center, width, amplitude):
+        """Returns one peak of the doublet and its derivatives with respect to amplitude, center and width."""
+        return lorentzian(x, center, width, amplitude)
+
+    def evaluate(self, x, p):
+        """Returns the model (n, m) and its Jacobian (n, k, m) for the parameters p (n, k) on the axis x (n, m)."""
+        shift, width, amplitude, offset = [p[:, i:i+1] for i in range(4)]
+        center = p[:, 4:5] if self.elastic_compensation else 0
+
+        stokes, d_stokes, dc_stokes, dw_stokes = self.peak(x, center - shift, width, amplitude)
+        anti_stokes, d_anti_stokes, dc_anti_stokes, dw_anti_stokes = self.peak(x, center + shift, width, amplitude)
+
+        jacobian = np.empty((stokes.shape[0], p.shape[1], stokes.shape[1]))
+        np.subtract(dc_anti_stokes, dc_stokes, out=jacobian[:, 0])
+        np.add(dw_stokes, dw_anti_stokes, out=jacobian[:, 1])
+        np.add(d_stokes, d_anti_stokes, out=jacobian[:, 2])
+        jacobian[:, 3] = 1
+        model = stokes
+        model += anti_stokes
+        model += offset
+
+        if self.elastic_compensation:
+            # The elastic peak itself is excluded from the fit, the distance to it is only bounded to stay finite
+            distance = x - center
+            tail = 1/np.maximum(distance*distance, 1e-6)
+            np.add(dc_stokes, dc_anti_stokes, out=jacobian[:, 4])
+            jacobian[:, 4] += 2*p[:, 5:6]*distance*tail*tail
+            jacobian[:, 5] = tail
+            model += p[:, 5:6]*tail
+        return model, jacobian
+
+    def initial_guess(self, x, y, exclusion):
+        """Estimates the parameters of all the spectra at once from the highest point outside of the elastic peak."""
+        n = y.shape[0]
+        rows = np.arange(n)
+        offset = np.percentile(y, 10, axis=1)
+        outside = np.abs(x) > exclusion
+        center = x[rows, np.argmax(np.where(outside, -np.inf, y), axis=1)] if self.elastic_compensation else np.zeros(n)
+        index = np.argmax(np.where(outside, y, -np.inf), axis=1)
+        shift = np.abs(x[rows, index] - center)
+        amplitude = np.maximum(y[rows, index] - offset, 1e-12)
+
+        # Full width at half maximum from the number of points of the same side above half the amplitude
+        step = np.abs(x[:, 1] - x[:, 0])
+        same_side = outside & (np.sign(x) == np.sign(x[rows, index])[:, None])
+        above = same_side & (y - offset[:, None] > amplitude[:, None]/2)
+        width = np.clip(np.sum(above, axis=1)*step, 2*step, shift)
+
+        p = [shift, width, amplitude, offset]
+        if self.elastic_compensation: p = p + [center, np.zeros(n)]
+        return np.stack(p, axis=1)
+
+    def valid(self, x, p):
+        """Returns whether the parameters of each spectrum are physically possible on the axis x: a positive
+        amplitude, and a shift and a linewidth within the range of the axis."""
+        span = np.max(x, axis=1) - np.min(x, axis=1)
+        extent = np.max(np.abs(x), axis=1)
+        return (np.isfinite(p).all(axis=1) & (p[:, 2] > 0) & (np.abs(p[:, 0]) <= extent)
+                & (np.abs(p[:, 1]) > 0) & (np.abs(p[:, 1]) <= span))
+
+    def finalize(self, p):
+        """Widths and shifts only enter the model through their absolute value."""
+        p = p.copy()
+        p[:, :2] = np.abs(p[:, :2])
+        return p
+
+class DHODoublet(LorentzianDoublet):
+    """Damped harmonic oscillator response A.(Linewidth.Shift)^2/((nu^2 - Shift^2)^2 + (Linewidth.nu)^2) on a constant offset.
+
+    A single DHO holds both the Stokes and the anti-Stokes peaks of height Amplitude, nu being measured from 0 or,
+    with elastic compensation, from the fitted center. The elastic tail is modelled as for LorentzianDoublet.
+    """
+    name = "DHO"
+
+    def evaluate(self, x, p):
+        """Returns the model (n, m) and its analytic Jacobian (n, k, m) for the parameters p (n, k) on the axis x (n, m)."""
+        shift, width, amplitude, offset = [p[:, i:i+1] for i in range(4)]
+        center = p[:, 4:5] if self.elastic_compensation else 0
+
+        nu = x - center
+        nu2 = nu*nu
+        q = nu2 - shift*shift
+        damping = width*width*nu2
+        d = q*q
+        d += damping
+        d = 1/np.maximum(d, 1e-300)
+        response = (width*shift)**2*d            # d(model)/d(Amplitude)
+        model = amplitude*response
+
+        jacobian = np.empty((model.shape[0], p.shape[1], model.shape[1]))
+        # d/dShift = 2A.W^2.S/D.(1 + 2S^2.q/D) and d/dWidth = 2A.W.S^2/D.(1 - W^2.nu^2/D)
+        np.multiply(model, 2/shift, out=jacobian[:, 0])
+        jacobian[:, 0] *= 1 + 2*shift*shift*q*d
+        np.multiply(model, 2/width, out=jacobian[:, 1])
+        jacobian[:, 1] *= 1 - damping*d
+        jacobian[:, 2] = response
+        jacobian[:, 3] = 1
+
+        if self.elastic_compensation:
+            # d/dCenter = -d/dnu = model.(4q + 2W^2).nu/D
+            tail = 1/np.maximum(nu2, 1e-6)
+            np.multiply(model, (4*q + 2*width*width)*nu*d, out=jacobian[:, 4])
+            jacobian[:, 4] += 2*p[:, 5:6]*nu*tail*tail
+            jacobian[:, 5] = tail
+            model += p[:, 5:6]*tail
+        model += offset
+        return model, jacobian
+
+def batch_levenberg_marquardt(model, x, y, p0, weights=None, max_iterations=100, tolerance=1e-6):
+    """Fits all the spectra of y (n, m) at once with a Levenberg-Marquardt algorithm.
+
+    model.evaluate(x, p) returns the model (n, m) and its Jacobian (n, k, m). x is either shared by all the spectra
+    (1, m) or given for each of them (n, m). Each spectrum has its own damping and stops iterating once converged.
+    Returns the parameters, their standard errors, the number of iterations and the convergence flag of each spectrum,
+    which is only set when its parameters are valid for the model.
+    """
+    n, k = p0.shape
+    if weights is None: weights = np.ones((1, y.shape[1]))
+    p = p0.astype(float).copy()
+    damping = np.full(n, 1e-3)
+    iterations = np.zeros(n, dtype=np.int32)
+    converged = np.zeros(n, dtype=bool)
+
+    def normal_equations(rows, p_rows):
+        """Returns the cost, J^T.J and J^T.r of the given spectra."""
+        x_rows = x if x.shape[0] == 1 else x[rows]
+        w_rows = weights if weights.shape[0] == 1 else weights[rows]
+        f, jacobian = model.evaluate(x_rows, p_rows)
+        r = f
+        r -= y[rows]
+        r *= w_rows
+        jacobian *= w_rows[:, None, :]
+        return np.einsum('ij,ij->i', r, r), jacobian @ jacobian.transpose(0, 2, 1), (jacobian @ r[..., None])[..., 0]
+
+    active = np.arange(n)
+    cost, jtj, jtr = normal_equations(active, p)
+    for _ in range(max_iterations):
+        if active.size == 0: break
+        iterations[active] += 1
+
+        # Damped normal equations of all the active spectra
+        diagonal = np.diagonal(jtj, axis1=1, axis2=2)
+        regularization = damping[active, None]*diagonal + 1e-12*(np.max(diagonal, axis=1, keepdims=True) + 1e-300)
+        system = jtj + regularization[:, :, None]*np.eye(k)
+        step = -np.linalg.solve(system, jtr[..., None])[..., 0]
+
+        p_new = p[active] + step
+        cost_new, jtj_new, jtr_new = normal_equations(active, p_new)
+        better = np.isfinite(cost_new) & (cost_new <= cost)
+
+        # Accept the steps that decrease the cost and adapt the damping
+        small = better & (((cost - cost_new) <= tolerance*cost) | (np.max(np.abs(step), axis=1) <= tolerance*(np.max(np.abs(p_new), axis=1) + tolerance)))
+        p[active[better]] = p_new[better]
+        damping[active] = np.where(better, damping[active]/10, damping[active]*10)
+        cost[better] = cost_new[better]
+        jtj[better] = jtj_new[better]
+        jtr[better] = jtr_new[better]
+
+        # Spectra that stopped improving or whose damping exploded stop iterating
+        done = small | (damping[active] > 1e10)
+        converged[active[small]] = True
+        keep = ~done
+        active, cost, jtj, jtr = active[keep], cost[keep], jtj[keep], jtr[keep]
+
+    # Fits ending on parameters that aren't physically possible didn't converge, whatever their last step
+    converged &= model.valid(np.broadcast_to(x, y.shape), p)
+
+    # Standard errors from the covariance matrix at the solution
+    cost, jtj, _ = normal_equations(np.arange(n), p)
+    dof = np.maximum(np.count_nonzero(np.broadcast_to(weights, y.shape), axis=1) - k, 1)
+    errors = np.full((n, k), np.nan)
+    finite = np.all(np.isfinite(jtj), axis=(1, 2)) & np.isfinite(cost)
+    covariance = np.linalg.pinv(jtj[finite])
+    errors[finite] = np.sqrt(np.abs(np.diagonal(covariance, axis1=1, axis2=2))*(cost[finite]/dof[finite])[:, None])
+    return p, errors, iterations, converged
+
+def weighted_cost(model, x, y, p, weights):
+    """Returns the weighted sum of squared residuals of each spectrum of y (n, m) for the parameters p (n, k)."""
+    f, _ = model.evaluate(x, p)
+    r = (f - y)*weights
+    return np.einsum('ij,ij->i', r, r)
+
+def fit_doublet(frequency, spectra, model, exclusion=None, poisson_weights=True, warm_start=False, batch_size=128, **kwargs):
+    """Fits a doublet model to a stack of spectra whose last axis is the spectral axis.
+
+    frequency is either a single axis or an array of the same shape as spectra. The points closer to 0 than
+    exclusion (default: a quarter of the frequency range) belong to the elastic peak and are not fitted. Counts are
+    weighted by their Poisson uncertainty unless poisson_weights is False. With warm_start, the lines of the map
+    (last spatial axis) are swept together and each spectrum starts from the parameters of its already fitted
+    neighbour when that one converged, and again from its own guess if that fit ends worse than the guess or on
+    invalid parameters (see LorentzianDoublet.valid), as happens across the boundaries of a sample. Returns a
+    dictionary of arrays of shape spectra.shape[:-1]: the fitted parameters, their uncertainties (suffix
+    "_Uncertainty"), the number of iterations and the convergence flag of each spectrum.
+    """
+    spectra = np.asarray(spectra, dtype=float)
+    shape = spectra.shape[:-1]
+    y = spectra.reshape(-1, spectra.shape[-1])
+    frequency = np.asarray(frequency, dtype=float)
+    x = frequency.reshape(1, -1) if frequency.ndim == 1 else np.broadcast_to(frequency, spectra.shape).reshape(y.shape)
+    if exclusion is None: exclusion = 0.25*np.max(np.abs(x))
+
+    p = np.empty((y.shape[0], len(model.parameters)))
+    errors = np.empty_like(p)
+    iterations = np.empty(y.shape[0], dtype=np.int32)
+    converged = np.empty(y.shape[0], dtype=bool)
+
+    def fit_rows(rows, neighbours=None):
+        x_rows = x if x.shape[0] == 1 else x[rows]
+        # The elastic peak is left out of the fit
+        weights = (np.abs(x_rows) > exclusion).astype(float)
+        if poisson_weights: weights = weights/np.sqrt(np.maximum(y[rows], 1))
+        p0 = model.initial_guess(np.broadcast_to(x_rows, y[rows].shape), y[rows], exclusion)
+        warm = converged[neighbours] if neighbours is not None else np.zeros(rows.size, dtype=bool)
+        cold = p0.copy()
+        if warm.any(): p0[warm] = model.finalize(p[neighbours[warm]])
+        p[rows], errors[rows], iterations[rows], converged[rows] = batch_levenberg_marquardt(model, x_rows, y[rows], p0, weights, **kwargs)
+        if not warm.any(): return
+
+        # A neighbour across a boundary of the map can lead the fit astray: fits started from a neighbour that end
+        # worse than the guess of the spectrum itself, or on invalid parameters, are started again from that guess
+        x_warm = x_rows if x_rows.shape[0] == 1 else x_rows[warm]
+        w_warm = weights if weights.shape[0] == 1 else weights[warm]
+        rows_warm = rows[warm]
+        worse = ~model.valid(np.broadcast_to(x_warm, y[rows_warm].shape), p[rows_warm])
+        worse |= weighted_cost(model, x_warm, y[rows_warm], p[rows_warm], w_warm) > weighted_cost(model, x_warm, y[rows_warm], cold[warm], w_warm)
+        if not worse.any(): return
+        refit = rows_warm[worse]
+        p[refit], errors[refit], iterations_cold, converged[refit] = batch_levenberg_marquardt(
+            model, x_warm if x_warm.shape[0] == 1 else x_warm[worse], y[refit], cold[warm][worse],
+            w_warm if w_warm.shape[0] == 1 else w_warm[worse], **kwargs)
+        iterations[refit] += iterations_cold
+
+    if warm_start:
+        # Lines of the map are fitted in parallel, one spectrum of each line at a time
+        line_length = shape[-1] if len(shape) > 1 else max(1, -(-y.shape[0]//batch_size))
+        starts = np.arange(0, y.shape[0], line_length)
+        for position in range(line_length):
+            rows = starts + position
+            rows = rows[rows < y.shape[0]]
+            for start in range(0, rows.size, batch_size):
+                batch = rows[start:start + batch_size]
+                fit_rows(batch, batch - 1 if position > 0 else None)
+    else:
+        for start in range(0, y.shape[0], batch_size):
+            fit_rows(np.arange(start, min(start + batch_size, y.shape[0])))
+    p = model.finalize(p)
+
+    results = {}
+    for i, name in enumerate(model.parameters):
+        results[name] = p[:, i].reshape(shape)
+        results[name+"_Uncertainty"] = errors[:, i].reshape(shape)
+    results["Iterations"] = iterations.reshape(shape)
+    results["Converged"] = converged.reshape(shape)
+    return results
+
+def fit_bh5(filepath, model, parent="Raw_data", **kwargs):
+    """Fits all the spectra of a dataset of the "Data" group and stores the results in a group derived from it."""
+    with h5py.File(filepath, 'a') as f:
+        spectra = f["Data"][parent][...]
+        frequency = frequency_axis(f, spectra.shape[-1])
+        results = fit_doublet(frequency, spectra, model, **kwargs)
+        write_fit(f["Data"], model, results, parent, kwargs.get("warm_start", False))
+    return results
+
+def write_fit(group, model, results, parent, warm_start=False):
+    """Stores the results of a fit in a group derived from the parent dataset."""
+    return write_treated_group(group, model.name+"_fit", results, parent,
+                               Fit_Model=model.name, Elastic_Compensation=model.elastic_compensation,
+                               Warm_Start=warm_start)
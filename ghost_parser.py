@@ -0,0 +1,60 @@
+import warnings
+import numpy as np
+
+def read_ghost_file(filepath):
+    """Reads a GHOST .DAT file and returns its header metadata and its counts as an int32 array."""
+    with open(filepath, 'rb') as file:
+        buffer = file.read()
+
+    metadata, data_start = parse_ghost_header(buffer)
+    data = parse_ghost_counts(buffer[data_start:])
+    return metadata, data
+
+def parse_ghost_header(buffer):
+    """Parses the header of a GHOST file and returns the metadata and the offset of the first count."""
+    metadata = {}
+    position = 0
+    while position < len(buffer):
+        end = buffer.find(b'\n', position)
+        if end == -1: end = len(buffer)
+        line = buffer[position:end].decode('latin-1')
+
+        if line.strip() != '':
+            if any(char.isdigit() for char in line.split()[0]):
+                break  # Stop at the first number
+            # Split metadata into key-value pairs
+            if ':' in line:
+                key, value = line.split(':', 1)
+                metadata[key.strip()] = value.strip()
+        position = end + 1
+    return metadata, position
+
+def parse_ghost_counts(tail):
+    """Parses the numerical tail of a GHOST file in a single pass."""
+    with warnings.catch_warnings():
+        # NumPy only warns when the buffer holds something else than integers
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(tail, dtype=np.int32, sep=' ')
+        except (DeprecationWarning, ValueError):
+            pass
+
+    # Slow path: keep only the lines holding a positive integer, as GHOST does
+    return np.array([int(e) for e in tail.split() if e.isdigit()], dtype=np.int32)
+
+def ghost_attributes(name, metadata, data):
+    """Returns the BH5 attributes that can be deduced from a GHOST file."""
+    attributes = {}
+    attributes['FILEPROP.BLS_HDF5_Version'] = '0.1'
+    attributes['FILEPROP.Name'] = name
+    attributes['MEASURE.Sample'] = metadata["Sample"]
+    attributes['SPECTROMETER.Scanning_Strategy'] = "point_scanning"
+    attributes['SPECTROMETER.Type'] = "TFP"
+    attributes['SPECTROMETER.Illumination_Type'] = "CW"
+    attributes['SPECTROMETER.Detector_Type'] = "Photon Counter"
+    attributes['SPECTROMETER.Filtering_Module'] = "None"
+    attributes['SPECTROMETER.Wavelength_nm'] = metadata["Wavelength"]
+    attributes['SPECTROMETER.Scan_Amplitude'] = metadata["Scan amplitude"]
+    spectral_resolution = float(float(metadata["Scan amplitude"])/data.shape[-1])
+    attributes['SPECTROMETER.Spectral_Resolution'] = str(spectral_resolution)
+    return attributes
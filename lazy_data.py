@@ -0,0 +1,97 @@
+import h5py
+import numpy as np
+
+def block_length(shape, itemsize, chunks=None, max_bytes=2**26):
+    """Returns the number of lines of the first axis of a dataset read at once, for blocks of at most max_bytes made of whole chunks."""
+    line_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64))*itemsize)
+    step = max(1, max_bytes//line_bytes)
+    if chunks is not None: step = max(chunks[0], step//chunks[0]*chunks[0])
+    return step
+
+def block_slices(shape, itemsize, chunks=None, max_bytes=2**26):
+    """Yields the slices of the blocks of whole spectra (last axis) of a dataset, made of whole chunks and of at most
+    max_bytes unless a single chunk is larger."""
+    if len(shape) < 2:
+        yield (slice(None),)
+        return
+    lead = shape[:-1]
+    block = list(chunks[:-1]) if chunks is not None else [1]*len(lead)
+    nbytes = int(np.prod(block, dtype=np.int64))*shape[-1]*itemsize
+    # Blocks grow along the last axes first, an axis only grows once the following ones are whole
+    for axis in reversed(range(len(lead))):
+        factor = min(max(1, max_bytes//nbytes), -(-lead[axis]//block[axis]))
+        block[axis] *= factor
+        nbytes *= factor
+        if block[axis] < lead[axis]: break
+    for index in np.ndindex(*[-(-n//b) for n, b in zip(lead, block)]):
+        yield tuple(slice(i*b, min((i + 1)*b, n)) for i, b, n in zip(index, block, lead))
+
+class LazyDataset:
+    """View of a dataset of a BH5 file that only reads the hyperslabs it is indexed with.
+
+    Contiguous datasets without filters are memory-mapped, so that indexing them reads the file directly without going
+    through HDF5. Other datasets are read from the file at each indexing, and iter_blocks streams them chunk by chunk.
+    The file isn't kept open between reads, so that it can be treated while the view is displayed.
+    """
+    def __init__(self, filepath, name="Raw_data", group="Data"):
+        self.filepath = filepath
+        self.path = group + "/" + name
+        with h5py.File(filepath, 'r') as f:
+            dataset = f[self.path]
+            self.shape, self.dtype, self.chunks = dataset.shape, dataset.dtype, dataset.chunks
+            offset = dataset.id.get_offset()
+            mappable = (dataset.chunks is None and offset is not None and dataset.external is None
+                        and dataset.dtype.kind in "biuf" and dataset.size > 0)
+        self.mmap = np.memmap(filepath, dtype=self.dtype, mode='r', offset=offset, shape=self.shape) if mappable else None
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self.mmap is not None: return np.asarray(self.mmap[key])
+        with h5py.File(self.filepath, 'r') as f:
+            return f[self.path][key]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def iter_blocks(self, max_bytes=2**26):
+        """Yields the (start, block) blocks of consecutive lines of the first axis, of at most max_bytes and made of whole chunks."""
+        if self.ndim == 0:
+            yield 0, self[()]
+            return
+        step = block_length(self.shape, self.dtype.itemsize, self.chunks, max_bytes)
+        if self.mmap is not None:
+            for start in range(0, self.shape[0], step):
+                yield start, np.asarray(self.mmap[start:start + step])
+            return
+        # The file stays open while the blocks are read
+        with h5py.File(self.filepath, 'r') as f:
+            dataset = f[self.path]
+            for start in range(0, self.shape[0], step):
+                yield start, dataset[start:start + step]
+
+    def spectrum(self, index=None):
+        """Returns a single spectrum (last axis) of the dataset: the first one of a map unless the index of its position is given."""
+        if index is None: index = (0,)*(self.ndim - 1)
+        return self[tuple(index)]
+
+def read_raw_data(filepaths, spectrum=False):
+    """Returns the (filepath, raw data, error) of BH5 files, only the first spectrum of maps if spectrum is True."""
+    raw_data = []
+    for filepath in filepaths:
+        try:
+            data = LazyDataset(filepath)
+            raw_data.append((filepath, data.spectrum() if spectrum else data[...], None))
+        except Exception as e:
+            raw_data.append((filepath, None, f"{e}"))
+    return raw_data
@@ -0,0 +1,86 @@
+import argparse
+import configparser
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import h5py
+import numpy as np
+from database_manager import DatabaseManager
+
+# Copy of the attributes of the BH5 files to the columns of their database, with the columns and attributes given in
+# the "Attribute Columns" section of the configuration file (column = attribute)
+
+def attribute_columns(config):
+    """Returns the attribute of the BH5 files copied to each column of the database."""
+    return dict(config["Attribute Columns"]) if config.has_section("Attribute Columns") else {}
+
+def read_attributes(filepath, mapping):
+    """Returns the values of the columns whose attribute is in a BH5 file. Missing attributes are left out."""
+    values = {}
+    with h5py.File(filepath, 'r') as f:
+        for column, attribute in mapping.items():
+            if attribute not in f.attrs: continue
+            value = f.attrs[attribute]
+            if isinstance(value, bytes): value = value.decode()
+            elif isinstance(value, np.ndarray): value = str(tuple(value.tolist()))
+            elif isinstance(value, np.generic): value = value.item()
+            values[column] = value
+    return values
+
+def sync_metadata(db_manager, filepaths=None, force=False, max_workers=None, progress=None):
+    """Copies the attributes of the BH5 files of a database (all of them by default) to its columns, in a single transaction.
+
+    The files are read in a pool of threads, which overlaps the latency of the file system. Files that weren't modified
+    since their last synchronisation are skipped unless force is True. progress(done, total) is called after each file.
+    Returns the list of updated filepaths and the list of (filepath, message) failures.
+    """
+    mapping = attribute_columns(db_manager.config)
+    db_manager.check_columns(*mapping)
+    synced = {row["filepath"]: row["bh5_mtime"] for row in db_manager.query(["filepath", "bh5_mtime"])}
+    filepaths = list(synced) if filepaths is None else list(filepaths)
+
+    def read(filepath):
+        try:
+            # The time is read first: a file modified while it is read is read again at the next synchronisation
+            mtime = os.stat(filepath).st_mtime
+            if not force and synced.get(filepath) == mtime: return None, None
+            values = read_attributes(filepath, mapping)
+            values["bh5_mtime"] = mtime
+            return values, None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    updates, failures = {}, []
+    workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, (filepath, (values, error)) in enumerate(zip(filepaths, executor.map(read, filepaths)), 1):
+            if error is not None: failures.append((filepath, error))
+            elif values is not None: updates[filepath] = values
+            if progress is not None: progress(done, len(filepaths))
+
+    if updates: db_manager.update_spectra(updates)
+    return list(updates), failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copies the attributes of the BH5 files of a database to its columns.")
+    parser.add_argument("database", help="SQLite database of the spectra")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of threads reading the files")
+    parser.add_argument("--force", action="store_true", help="also read the files that weren't modified since the last synchronisation")
+    parser.add_argument("-c", "--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini"),
+                        help="configuration file (default: config.ini of the interface)")
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    db_manager = DatabaseManager(args.database, config)
+    db_manager.connect(compatibility=True)
+
+    updated, failures = sync_metadata(db_manager, force=args.force, max_workers=args.workers)
+    for filepath, message in failures:
+        print(f"{filepath}: {message}", file=sys.stderr)
+    print(f"{len(updated)} spectra updated, {len(failures)} failures", file=sys.stderr)
+    db_manager.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import h5py
+import numpy as np
+from deconvolution import read_impulse_response, impulse_response_kernel, deconvolve
+from fitting import LorentzianDoublet, DHODoublet, fit_doublet, write_fit
+from bh5_writer import spectrum_chunks, content_digest
+from calibration import read_calibration
+from treatment import frequency_axis, store_frequency_axis, bin_image, bin_rois, write_treated_dataset, create_treated_dataset, create_treated_group, noise_mask, subtract_noise_average, normalize_peaks, iter_blocks
+
+# A recipe is the ordered list of the treatment steps applied to a BH5 file: {"steps": [{"treatment": name, parameter: value, ...}]}.
+# Every dataset written by a step stores the step ("Step") and a hash of the step and of its inputs ("Step_Hash"),
+# so that the recipe can be read back from a treated file and a step is only applied again when one of them changed.
+# The datasets not written by a step, such as the raw data, store the hash of their content ("Content_Hash"), written
+# with the raw data or the first time a step reads them, so that their content is only hashed once.
+
+models = {"Lorentzian": LorentzianDoublet, "DHO": DHODoublet}
+
+# Maximum number of spectra treated at once when spectra of several files are stacked
+max_stacked_spectra = 2**16
+
+def step_output(step):
+    """Returns the name of the dataset or group written in the "Data" group by a step."""
+    treatment = step["treatment"]
+    if treatment == "Frequency": return "Frequency"
+    if treatment == "Bin": return step.get("name", "binned")
+    if treatment == "Subtract Noise": return step.get("name", "Noise_subtracted")
+    if treatment == "Normalize": return step.get("name", "Normalized")
+    if treatment == "Deconvolve": return "Deconvolved"
+    if treatment == "Fit": return step.get("model", "Lorentzian")+"_fit"
+    raise ValueError(f"Unknown treatment: {treatment}")
+
+def content_hash(obj):
+    """Returns the hash of the content of a dataset or of all the datasets of a group."""
+    h = hashlib.sha1()
+    if isinstance(obj, h5py.Group):
+        for name in sorted(obj):
+            h.update(name.encode())
+            h.update(content_hash(obj[name]).encode())
+        return h.hexdigest()
+    # Large datasets are read by blocks of about 16 MB
+    return content_digest(obj)
+
+def stored_hash(f, name, hashes=None):
+    """Returns the hash of a dataset of the "Data" group known without reading it, None if its content has to be hashed."""
+    obj = f["Data"][name]
+    if "Step_Hash" in obj.attrs: return obj.attrs["Step_Hash"]
+    if "Content_Hash" in obj.attrs: return obj.attrs["Content_Hash"]
+    if hashes is not None: return hashes.get((f.filename, name))
+    return None
+
+def input_hash(f, name, hashes=None, data=None):
+    """Returns the hash of a dataset of the "Data" group: the hash of the step that wrote it, or the hash of its content.
+
+    data is the content of the dataset when it was already read. The hash of the content of a dataset is stored with
+    it when the file is open for writing.
+    """
+    digest = stored_hash(f, name, hashes)
+    if digest is not None: return digest
+    obj = f["Data"][name]
+    digest = content_digest(data) if data is not None and isinstance(obj, h5py.Dataset) else content_hash(obj)
+    if isinstance(obj, h5py.Dataset) and f.mode == 'r+': obj.attrs["Content_Hash"] = digest
+    if hashes is not None: hashes[(f.filename, name)] = digest
+    return digest
+
+def step_hash(f, step, hashes=None, data=None, other=None):
+    """Returns the hash of a step applied to an open BH5 file: the step itself, its parent and its other inputs.
+
+    data and other are the content of the parent and the other input of the step (the impulse response of a
+    deconvolution, the frequency axis of a fit) when they were already read.
+    """
+    parent = step.get("parent", "Raw_data")
+    h = hashlib.sha1(json.dumps(step, sort_keys=True).encode())
+    h.update(input_hash(f, parent, hashes, data).encode())
+    if other is None:
+        if step["treatment"] == "Deconvolve": other = read_impulse_response(f)
+        elif step["treatment"] == "Frequency":
+            # The stored axis follows the calibration of the file
+            calibration = read_calibration(f)
+            if calibration is not None: other = calibration[1]
+        elif step["treatment"] == "Fit":
+            # Normalized spectra come with the frequency axis of each spectrum
+            if isinstance(f["Data"][parent], h5py.Group): other = f["Data"][parent]["Frequency"][...]
+            else: other = frequency_axis(f, f["Data"][parent].shape[-1])
+        elif step["treatment"] == "Bin" and "masks" in step: other = f["Data"][step["masks"]][...]
+        elif step["treatment"] == "Normalize" or (step["treatment"] == "Subtract Noise" and step.get("unit", "frequency") == "frequency"):
+            other = frequency_axis(f, f["Data"][parent].shape[-1])
+    if other is not None:
+        h.update(np.ascontiguousarray(other, dtype=float).tobytes())
+    return h.hexdigest()
+
+def record_step(obj, step, digest):
+    """Stores the step that wrote a dataset or group, its hash and its position among the steps applied to the file."""
+    # The "Data" group counts the steps applied to the file
+    order = int(obj.parent.attrs.get("Step_Count", 0)) + 1
+    obj.parent.attrs["Step_Count"] = order
+    obj.attrs["Step"] = json.dumps(step, sort_keys=True)
+    obj.attrs["Step_Hash"] = digest
+    obj.attrs["Step_Order"] = order
+
+def parameters(step, *exclude):
+    """Returns the parameters of a step that are passed to the treatment function."""
+    return {k: v for k, v in step.items() if k not in ("treatment", "parent") + exclude}
+
+def outdated(f, step, force=False, hashes=None, data=None, other=None):
+    """Returns the hash of a step if it has to be applied to an open BH5 file, None if its output is up to date."""
+    digest = step_hash(f, step, hashes, data, other)
+    output = step_output(step)
+    if not force and output in f["Data"] and f["Data"][output].attrs.get("Step_Hash") == digest: return None
+    return digest
+
+def per_file(function):
+    """Applies a step to the files one at a time. function(f, step) returns the dataset or group it wrote."""
+    def apply(filepaths, step, force=False, hashes=None):
+        treated, failures = [], []
+        for filepath in filepaths:
+            try:
+                # The file is only opened once to check and treat it
+                with h5py.File(filepath, 'a') as f:
+                    digest = outdated(f, step, force, hashes)
+                    if digest is None: continue
+                    record_step(function(f, step), step, digest)
+                treated.append(filepath)
+            except Exception as e:
+                failures.append((filepath, f"{type(e).__name__}: {e}"))
+        return treated, failures
+    return apply
+
+def stacked(read, treat, write):
+    """Applies a step to the files by stacking their spectra when their inputs are compatible.
+
+    read(f, step) returns the spectra of a file, the key of the files that can be stacked with it (None if the file
+    has to be treated alone) and the other input of the treatment. treat(spectra, shape, other, step) treats a stack
+    of spectra (last axis) of the given original shape (None for a stack of several files) and
+    write(f, step, result) writes the result of a file and returns the dataset or group it wrote.
+    """
+    def apply(filepaths, step, force=False, hashes=None):
+        treated, failures = [], []
+        # Files read but not treated yet and their number of spectra, by key of the files stacked together
+        groups, counts = {}, {}
+
+        def flush(group):
+            batch = groups.pop(group)
+            del counts[group]
+            failed = dict(treat_stack(batch, step, treat, write))
+            failures.extend(failed.items())
+            treated.extend(entry[0] for entry in batch if entry[0] not in failed)
+
+        for filepath in filepaths:
+            try:
+                # The inputs are read once to check and treat the file, and not at all when the hash of the parent
+                # is known and the output is up to date
+                with h5py.File(filepath, 'r') as f:
+                    if not force and stored_hash(f, step.get("parent", "Raw_data"), hashes) is not None \
+                            and outdated(f, step, force, hashes) is None: continue
+                    spectra, key, other = read(f, step)
+                    digest = outdated(f, step, force, hashes, spectra, other)
+                    if digest is None: continue
+            except Exception as e:
+                failures.append((filepath, f"{type(e).__name__}: {e}"))
+                continue
+            group = key if key is not None else filepath
+            groups.setdefault(group, []).append((filepath, digest, spectra, key, other))
+            counts[group] = counts.get(group, 0) + spectra.size//spectra.shape[-1]
+            # Files are treated as soon as their stack is full, or alone, so that at most about max_stacked_spectra
+            # spectra are held in memory whatever the number of files
+            if key is None or counts[group] >= max_stacked_spectra: flush(group)
+            while sum(counts.values()) >= max_stacked_spectra:
+                flush(max(counts, key=counts.get))
+
+        for group in list(groups):
+            flush(group)
+        return treated, failures
+    return apply
+
+def treat_stack(batch, step, treat, write):
+    """Treats the spectra of several files at once and writes the result of each file."""
+    m = batch[0][2].shape[-1]
+    shape = batch[0][2].shape if batch[0][3] is None else None
+    try:
+        results = treat(np.concatenate([e[2].reshape(-1, m) for e in batch]), shape, batch[0][4], step)
+    except Exception as e:
+        return [(entry[0], f"{type(e).__name__}: {e}") for entry in batch]
+
+    failures = []
+    start = 0
+    for filepath, digest, spectra, _, _ in batch:
+        nb = spectra.size//m
+        if isinstance(results, dict): result = {k: v[start:start + nb].reshape(spectra.shape[:-1]) for k, v in results.items()}
+        else: result = results[start:start + nb].reshape(spectra.shape)
+        start += nb
+        try:
+            with h5py.File(filepath, 'a') as f:
+                record_step(write(f, step, result), step, digest)
+        except Exception as e:
+            failures.append((filepath, f"{type(e).__name__}: {e}"))
+    return failures
+
+def frequency_step(f, step):
+    store_frequency_axis(f, f["Data"][step.get("parent", "Raw_data")].shape[-1])
+    return f["Data"]["Frequency"]
+
+def bin_step(f, step):
+    parent = step.get("parent", "Raw_data")
+    data = f["Data"][parent]
+    if "axes" not in step:
+        # Image binned along its lines or columns, as in the treatment window
+        y = bin_image(data, step["axis"], step["start"], step["stop"])
+        return write_treated_dataset(f["Data"], step_output(step), y, parent,
+                                     Bin_axis=step["axis"], Bin_Start=step["start"], Bin_Stop=step["stop"])
+    # Any axes, with ROIs given by windows or by the weights of a dataset of the "Data" group
+    rois = step["rois"] if "rois" in step else roi_masks(f, step)
+    y = bin_rois(data, step["axes"], rois)
+    if len(rois) == 1: y = y[0]
+    return write_treated_dataset(f["Data"], step_output(step), y, parent, Bin_Axes=step["axes"],
+                                 **({"Bin_ROIs": step["rois"]} if "rois" in step else {"Bin_Masks": step["masks"]}))
+
+def roi_masks(f, step):
+    """Returns the weighted masks of a binning step, stored in a dataset of the "Data" group (one mask or a stack of masks)."""
+    masks = f["Data"][step["masks"]][...]
+    return list(masks) if masks.ndim > len(step["axes"]) else [masks]
+
+def noise_step(f, step):
+    parent = step.get("parent", "Raw_data")
+    data = f["Data"][parent]
+    unit = step.get("unit", "frequency")
+    # The windows are given on the frequency axis, or in channels
+    axis = frequency_axis(f, data.shape[-1]) if unit == "frequency" else np.arange(data.shape[-1])
+    mask = noise_mask(axis, step["windows"])
+    # Counts become floats, in single precision unless the parent needs more
+    output = create_treated_dataset(f["Data"], step_output(step), data, np.result_type(data.dtype, np.float32), parent,
+                                    Noise_Windows=step["windows"], Noise_Unit=unit)
+    # Maps are read and written by blocks of about 16 MB of spectra, whatever their size
+    for index, block in iter_blocks(data, max_bytes=2**24):
+        output[index] = subtract_noise_average(block, mask)
+    return output
+
+def normalize_step(f, step):
+    parent = step.get("parent", "Raw_data")
+    data = f["Data"][parent]
+    frequency = frequency_axis(f, data.shape[-1])
+    kwargs = parameters(step, "name")
+    output = create_treated_group(f["Data"], step_output(step), parent, Peak=kwargs.get("peak", "Brillouin"), Exclusion=kwargs.get("exclusion"))
+    # The results are chunked along whole spectra, with the chunks and filters of the parent when it has some
+    dtype = np.result_type(data.dtype, np.float32)
+    chunks = data.chunks or spectrum_chunks(data.shape, dtype)
+    layout = dict(compression=data.compression, compression_opts=data.compression_opts, shuffle=data.shuffle)
+    datasets = {name: output.create_dataset(name, shape=data.shape, dtype=dtype, chunks=chunks, **layout) for name in ("Spectra", "Frequency")}
+    for name in ("Elastic_Shift", "Brillouin_Shift", "Peak_Intensity"):
+        # A single spectrum has a single value of each
+        datasets[name] = output.create_dataset(name, shape=data.shape[:-1], dtype=float, **(dict(chunks=chunks[:-1], **layout) if data.ndim > 1 else {}))
+    for index, block in iter_blocks(data, max_bytes=2**24):
+        for name, values in normalize_peaks(frequency, block, **kwargs).items():
+            datasets[name][index if np.ndim(values) else ()] = values
+    return output
+
+def read_deconvolve(f, step):
+    spectra = f["Data"][step.get("parent", "Raw_data")][...]
+    impulse_response = np.asarray(read_impulse_response(f), dtype=float)
+    # Files sharing the spectral length and the impulse response share the kernel
+    return spectra, (spectra.shape[-1], hashlib.sha1(impulse_response.tobytes()).hexdigest()), impulse_response
+
+def treat_deconvolve(spectra, shape, impulse_response, step):
+    kernel = impulse_response_kernel(impulse_response, spectra.shape[-1])
+    return deconvolve(spectra, kernel, step.get("method", "Wiener"), **parameters(step, "method"))
+
+def write_deconvolve(f, step, result):
+    return write_treated_dataset(f["Data"], "Deconvolved", result, step.get("parent", "Raw_data"),
+                                 Method=step.get("method", "Wiener"), **parameters(step, "method"))
+
+def read_fit(f, step):
+    parent = f["Data"][step.get("parent", "Raw_data")]
+    if isinstance(parent, h5py.Group):
+        # Normalized spectra come with the frequency axis of each spectrum, their files aren't stacked
+        return parent["Spectra"][...], None, parent["Frequency"][...]
+    spectra = parent[...]
+    frequency = frequency_axis(f, spectra.shape[-1])
+    # Maps fitted with warm starts need their spatial neighbours: they are fitted alone
+    if step.get("warm_start", False) and spectra.ndim > 1: return spectra, None, frequency
+    return spectra, frequency.tobytes(), frequency
+
+def treat_fit(spectra, shape, frequency, step):
+    model = models[step.get("model", "Lorentzian")](step.get("elastic_compensation", False))
+    kwargs = parameters(step, "model", "elastic_compensation")
+    if shape is None:
+        kwargs.pop("warm_start", None)
+        return fit_doublet(frequency, spectra, model, **kwargs)
+    return {k: v.reshape(-1) for k, v in fit_doublet(frequency, spectra.reshape(shape), model, **kwargs).items()}
+
+def write_fit_step(f, step, result):
+    model = models[step.get("model", "Lorentzian")](step.get("elastic_compensation", False))
+    return write_fit(f["Data"], model, result, step.get("parent", "Raw_data"), step.get("warm_start", False))
+
+treatments = {"Frequency": per_file(frequency_step),
+              "Bin": per_file(bin_step),
+              "Subtract Noise": per_file(noise_step),
+              "Normalize": per_file(normalize_step),
+              "Deconvolve": stacked(read_deconvolve, treat_deconvolve, write_deconvolve),
+              "Fit": stacked(read_fit, treat_fit, write_fit_step)}
+
+def check_recipe(recipe):
+    """Raises a ValueError if a step of the recipe isn't a known treatment."""
+    for step in recipe["steps"]:
+        if step.get("treatment") not in treatments:
+            raise ValueError(f"Unknown treatment: {step.get('treatment')}")
+    return recipe
+
+def fits_spectra(recipe):
+    """Returns whether a recipe has a fit step, whose results are copied to the database."""
+    return any(step["treatment"] == "Fit" for step in recipe["steps"])
+
+def load_recipe(filepath):
+    """Reads a recipe from a JSON file."""
+    with open(filepath, 'r') as file:
+        return check_recipe(json.load(file))
+
+def save_recipe(recipe, filepath):
+    """Writes a recipe to a JSON file."""
+    with open(filepath, 'w') as file:
+        json.dump(recipe, file, indent=4)
+
+def recipe_from_bh5(filepath):
+    """Returns the recipe of the steps recorded in a BH5 file, parents before their children."""
+    with h5py.File(filepath, 'r') as f:
+        recorded = {name: (json.loads(obj.attrs["Step"]), obj.attrs.get("Step_Order", 0)) for name, obj in f["Data"].items() if "Step" in obj.attrs}
+
+    def depth(name):
+        parent = recorded[name][0].get("parent", "Raw_data")
+        return 1 + depth(parent) if parent in recorded and parent != name else 0
+
+    # The frequency axis is used by the fits, it comes first
+    order = sorted(recorded, key=lambda name: (depth(name), recorded[name][0]["treatment"] != "Frequency", recorded[name][1]))
+    return {"steps": [recorded[name][0] for name in order]}
+
+def replay(filepaths, recipe, force=False, progress=None):
+    """Applies the steps of a recipe to BH5 files, one step at a time over all the files.
+
+    A step is skipped on a file when its output was written by the same step with the same inputs, unless force is
+    True. progress(done, total) is called after each step. Returns the dictionary of the treatments applied to each
+    file and the list of (filepath, message) failures. A file is left out of the next steps once a step failed on it.
+    """
+    check_recipe(recipe)
+    applied = {filepath: [] for filepath in filepaths}
+    failures = {}
+    hashes = {}
+    for done, step in enumerate(recipe["steps"], 1):
+        # Steps without parent apply to the raw data, they are recorded as such
+        step = {"parent": "Raw_data", **step}
+        treated, failed = treatments[step["treatment"]]([e for e in filepaths if e not in failures], step, force, hashes)
+        failures.update(failed)
+        for filepath in treated: applied[filepath].append(step["treatment"])
+        if progress is not None: progress(done, len(recipe["steps"]))
+    return applied, list(failures.items())
+
+def apply_step(filepath, step):
+    """Applies a single step to a BH5 file, replacing its previous output. Raises a RuntimeError if it fails."""
+    _, failures = replay([filepath], {"steps": [step]}, force=True)
+    if failures: raise RuntimeError(failures[0][1])
@@ -0,0 +1,149 @@
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+class SpectraTableModel(QAbstractTableModel):
+    """Table of the spectra of the database, read from SQLite by pages of rows as the view scrolls down.
+
+    Only the id, the filepath and the visible columns are read. Rows are ordered by id, so that new spectra are
+    appended at the end of the table.
+    """
+    def __init__(self, columns, page_size=500, parent=None):
+        super().__init__(parent)
+        self.db_manager = None
+        self.columns = list(columns)
+        self.visible = set(self.columns)
+        self.page_size = page_size
+        self.ids = []        # id of the spectrum displayed on each row
+        self.row_by_id = {}  # row displaying each spectrum, by id
+        self.values = {}     # values of the loaded columns of each spectrum, by id
+        self.total = 0       # number of spectra in the database
+
+    def set_database(self, db_manager):
+        """Displays the spectra of a database."""
+        self.db_manager = db_manager
+        self.reload()
+        if self.canFetchMore(): self.fetchMore()
+
+    def loaded_columns(self):
+        """Returns the columns read from the database."""
+        columns = ["id", "filepath"]
+        return columns + [e for e in self.columns if e in self.visible and e not in columns]
+
+    def count(self):
+        with self.db_manager.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM spectra").fetchone()[0]
+
+    def select(self, where, parameters):
+        """Returns the loaded columns of the spectra matching a WHERE clause, by id."""
+        columns = self.loaded_columns()
+        with self.db_manager.connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM spectra WHERE {where} ORDER BY id", parameters).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def reload(self):
+        """Forgets the loaded rows, the view fetches the first page again."""
+        self.beginResetModel()
+        self.ids = []
+        self.row_by_id = {}
+        self.values = {}
+        self.total = self.count() if self.db_manager is not None else 0
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole: return None
+        value = self.values[self.ids[index.row()]].get(self.columns[index.column()])
+        if value is None:
+            # NULL values are shown empty, the columns not loaded have no data
+            return "" if self.columns[index.column()] in self.visible else None
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.db_manager is not None and len(self.ids) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Reads the next page of rows."""
+        if parent.isValid() or self.db_manager is None: return
+        last_id = self.ids[-1] if self.ids else -1
+        columns = self.loaded_columns()
+        with self.db_manager.connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM spectra WHERE id > ? ORDER BY id LIMIT ?", (last_id, self.page_size)).fetchall()
+        if not rows:
+            self.total = len(self.ids)
+            return
+        self.beginInsertRows(QModelIndex(), len(self.ids), len(self.ids) + len(rows) - 1)
+        for row in rows:
+            values = dict(zip(columns, row))
+            self.row_by_id[values["id"]] = len(self.ids)
+            self.ids.append(values["id"])
+            self.values[values["id"]] = values
+        self.endInsertRows()
+
+    def set_visible_columns(self, columns):
+        """Reads the columns that become visible for the rows already loaded."""
+        new = [e for e in columns if e not in self.visible]
+        self.visible = set(columns)
+        if new and self.ids:
+            for values in self.select("id BETWEEN ? AND ?", (self.ids[0], self.ids[-1])):
+                if values["id"] in self.values: self.values[values["id"]] = values
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.ids) - 1, len(self.columns) - 1))
+
+    def fetch_new_rows(self):
+        """Displays the spectra added to the database since the rows were loaded."""
+        loaded_all = len(self.ids) >= self.total
+        self.total = self.count()
+        if loaded_all and self.canFetchMore(): self.fetchMore()
+
+    def row_of_id(self, spectrum_id):
+        """Returns the row displaying a spectrum, None if it isn't loaded."""
+        return self.row_by_id.get(spectrum_id)
+
+    def ids_of_rows(self, rows):
+        """Returns the ids of the spectra displayed on the given rows, each id once."""
+        return [self.ids[row] for row in sorted(set(rows))]
+
+    def update_spectrum(self, filepath):
+        """Reads again the row of the spectrum stored in a BH5 file."""
+        for values in self.select("filepath = ?", (filepath,)):
+            row = self.row_of_id(values["id"])
+            if row is None: continue
+            self.values[values["id"]] = values
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.columns) - 1))
+
+    def remove_spectrum(self, spectrum_id):
+        """Removes the row of a spectrum deleted from the database."""
+        self.remove_spectra([spectrum_id])
+
+    def remove_spectra(self, spectrum_ids):
+        """Removes the rows of spectra deleted from the database, one block of consecutive rows at a time."""
+        rows = sorted(set(row for row in map(self.row_of_id, spectrum_ids) if row is not None))
+        if not rows: return
+        # Blocks are removed from the last one, so that the rows of the others don't move
+        blocks = []
+        for row in rows:
+            if blocks and blocks[-1][1] == row - 1: blocks[-1][1] = row
+            else: blocks.append([row, row])
+        for first, last in reversed(blocks):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for spectrum_id in self.ids[first:last + 1]:
+                del self.values[spectrum_id]
+                del self.row_by_id[spectrum_id]
+            del self.ids[first:last + 1]
+            self.endRemoveRows()
+        # The rows following the first removed row moved up
+        for i in range(rows[0], len(self.ids)):
+            self.row_by_id[self.ids[i]] = i
+        self.total -= len(rows)
+
+    def filepath(self, row):
+        """Returns the BH5 filepath of the spectrum displayed on a row."""
+        return self.values[self.ids[row]]["filepath"]
@@ -0,0 +1,101 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Reads and writes of BH5 files and of the database are run in a thread pool so that the interface stays responsive.
+# Results, progress and errors come back to the interface through the signals of the tasks, which are delivered in the
+# thread of the interface. Tasks are run one at a time, in the order they were started, so that a BH5 file is never
+# written by a task while another one reads it.
+
+class TaskCancelled(Exception):
+    """Raised by the progress callback of a task once it is cancelled, to stop its function."""
+
+class TaskSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    done = pyqtSignal()
+
+class Task(QRunnable):
+    """Call of a function in the thread pool, whose result is sent by the finished signal and errors by the failed signal.
+
+    With progress True, the function is called with a progress(done, total) argument that emits the progress signal
+    and stops the function by raising TaskCancelled once the task is cancelled. Functions that stop by themselves are
+    given the function stopping them as on_cancel, their progress is then never interrupted. The connections of the
+    thread to the database of db_manager are closed when the function returns.
+    """
+    def __init__(self, function, args=(), kwargs=None, progress=False, on_cancel=None, db_manager=None):
+        super().__init__()
+        # The task is kept by the pool of tasks until its signals are delivered
+        self.setAutoDelete(False)
+        self.function = function
+        self.args = args
+        self.kwargs = dict(kwargs or {})
+        if progress: self.kwargs["progress"] = self.report
+        self.on_cancel = on_cancel
+        self.db_manager = db_manager
+        self.cancelled = False
+        self.signals = TaskSignals()
+
+    def cancel(self):
+        """Stops the task at its next progress report, or before it starts."""
+        self.cancelled = True
+        if self.on_cancel is not None: self.on_cancel()
+
+    def report(self, done, total):
+        self.signals.progress.emit(done, total)
+        if self.cancelled and self.on_cancel is None: raise TaskCancelled()
+
+    def run(self):
+        try:
+            if self.cancelled: raise TaskCancelled()
+            result = self.function(*self.args, **self.kwargs)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(f"{e}")
+        else:
+            # The result of a cancelled task is still delivered when its function stopped by itself
+            if self.cancelled and self.on_cancel is None: self.signals.cancelled.emit()
+            else: self.signals.finished.emit(result)
+        finally:
+            if self.db_manager is not None: self.db_manager.close_thread_connection()
+            self.signals.done.emit()
+
+class TaskPool:
+    """Single thread running the tasks of the interface one after the other."""
+    def __init__(self):
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.running = set()
+
+    def start(self, task, finished=None, failed=None, progress=None, cancelled=None):
+        """Starts a task and connects its signals to the given slots. Returns the task."""
+        for signal, slot in ((task.signals.finished, finished), (task.signals.failed, failed),
+                             (task.signals.progress, progress), (task.signals.cancelled, cancelled)):
+            if slot is not None: signal.connect(slot)
+        self.running.add(task)
+        task.signals.done.connect(lambda: self.running.discard(task))
+        self.pool.start(task)
+        return task
+
+    def cancel_all(self):
+        for task in list(self.running):
+            task.cancel()
+
+    def wait(self, msecs=-1):
+        """Waits until all the tasks are run. Returns False if they are still running after msecs milliseconds."""
+        return self.pool.waitForDone(msecs)
+
+pool = None
+
+def task_pool():
+    """Returns the pool of tasks of the application, created with the first task."""
+    global pool
+    if pool is None: pool = TaskPool()
+    return pool
+
+def start_task(function, *args, finished=None, failed=None, progress=None, cancelled=None, on_cancel=None, db_manager=None, **kwargs):
+    """Runs function(*args, **kwargs) in the pool of tasks. progress(done, total) is given to the function when a slot is
+    connected to it. Returns the task, which can be cancelled."""
+    task = Task(function, args, kwargs, progress=progress is not None, on_cancel=on_cancel, db_manager=db_manager)
+    return task_pool().start(task, finished, failed, progress, cancelled)
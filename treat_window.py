@@ -0,0 +1,734 @@
+import os
+import numpy as np
+import h5py
+from PyQt5.QtWidgets import QMainWindow, QPushButton, QHBoxLayout, QWidget, QFileDialog, QMessageBox, QVBoxLayout, QFrame, QLabel, QComboBox, QTreeWidget, QTreeWidgetItem, QSpinBox, QDoubleSpinBox, QProgressDialog, QInputDialog
+from PyQt5.QtCore import Qt
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+from fitting import LorentzianDoublet, DHODoublet
+from treatment import binning_prefix, bin_prefix, treatment_tree, frequency_source, now
+from deconvolution import read_impulse_response, store_impulse_response
+from decimation import plot_decimated, imshow_pyramid
+from blitting import BlitLine
+from fit_results import store_fit_results
+from lazy_data import LazyDataset, read_raw_data
+from tasks import start_task, TaskCancelled
+from recipe import apply_step, recipe_from_bh5, save_recipe, load_recipe, replay, fits_spectra
+
+# Treatment window of the interface. It is imported when it is first opened, so that matplotlib and h5py are only
+# loaded once the main window is displayed.
+
+# Functions run in the pool of tasks, outside of the thread of the interface
+
+def write_frequency_axis(filepath, frequency, date, calibration = None):
+    """Stores the frequency axis of a BH5 file, replacing the previous one, with the hash of the calibration it was computed from."""
+    with h5py.File(filepath, 'a') as f:
+        if "Frequency" in f["Data"]: del f["Data"]["Frequency"]
+        f["Data"].create_dataset("Frequency", data=frequency)
+        f["Data"]["Frequency"].attrs["Date"] = date
+        if calibration is not None: f["Data"]["Frequency"].attrs["Calibration_Hash"] = calibration
+
+def treat_and_store(db_manager, filepath, step):
+    """Applies a treatment step to a BH5 file and copies its fit results to the database."""
+    apply_step(filepath, step)
+    if step["treatment"] == "Fit": store_fit_results(db_manager, [filepath])
+
+def replay_and_store(db_manager, filepaths, recipe, progress = None):
+    """Replays a recipe on BH5 files and copies the fit results of the treated files to the database."""
+    fits = fits_spectra(recipe)
+    try:
+        applied, failures = replay(filepaths, recipe, progress = progress)
+    except TaskCancelled:
+        # The steps applied before the cancellation are kept, as well as their fit results when they can be copied:
+        # a failure to copy them doesn't hide the cancellation
+        try:
+            if fits: store_fit_results(db_manager, filepaths)
+        except Exception:
+            pass
+        raise
+    failed = dict(failures)
+    try:
+        if fits: store_fit_results(db_manager, [filepath for filepath in filepaths if filepath not in failed])
+        error = None
+    except Exception as e:
+        error = f"{e}"
+    return applied, failures, error
+
+class TreatSpectra(QMainWindow):
+    def __init__(self, parent, spectra_selected):
+        super().__init__(parent)
+
+        self.spectra_selected = spectra_selected
+        self.db_manager = parent.db_manager
+        self.spectral_unit = "channel"  # Unit of the horizontal axis of the displayed spectra
+        self.setWindowTitle("Treat Spectra")
+        self.setGeometry(100, 100, 1000, 600)  # Window size
+        
+        self.initUI()
+
+    def add_treatment(self):
+        # Check if an item in the tree view is selected
+        selected_item = self.right_frame_dic["child"]["treeview_layout"]["child"]["treeview"]["elt"].currentItem()
+        if selected_item is None:
+            QMessageBox.warning(self, "Selection Error", "Please select an item in the treatment steps.")
+            return
+
+        # Extract the name of the selected item in the tree view
+        selected_item_name = selected_item.text(0)
+        treatment = self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_treat"].currentText()
+
+        if treatment == "--Subtract Noise Average--": 
+            self.treat_subtract_noise_average(selected_item_name)
+        elif treatment == "--Normalize intensity of peak to unity--":
+            self.treat_normalize(selected_item_name)
+        elif treatment == "--Decovolve spectrum--":
+            self.treat_deconvolve(selected_item_name)
+        elif treatment.startswith("--Lorentzian fit on peak doublet"):
+            self.treat_fit(LorentzianDoublet(elastic_compensation = "without" not in treatment), selected_item_name)
+        elif treatment.startswith("--DHO fit on peak doublet"):
+            self.treat_fit(DHODoublet(elastic_compensation = "without" not in treatment), selected_item_name)
+
+    def get_frequency(self, filepath, name, arr = None):
+        def read_frequency(f):
+            # The stored axis is kept, an axis computed from the calibration or the TFP scan is stored without asking
+            try:
+                frequency, calibration = frequency_source(f, arr.shape[-1])
+            except ValueError:
+                return None, "NONE"
+            if calibration is None and "Frequency" in f["Data"] and f["Data"]["Frequency"].shape[-1] == arr.shape[-1]:
+                return frequency, f["Data"]["Frequency"].attrs.get("Date", "NONE")
+            date_frequency = now()
+            to_store.append((frequency, date_frequency, calibration))
+            return frequency, date_frequency
+
+        def button_bin_visible():
+            if self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_bin"].currentData() is None:
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_bin_button"].setEnabled(False)
+            else: 
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_bin_button"].setEnabled(True)
+
+        def bin_signal():
+            def apply_binning():
+                start = int(self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"]["bin_start_spinbox"].value())
+                stop = int(self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"]["bin_stop_spinbox"].value())
+                with h5py.File(filepath, 'r') as f:
+                    exists = "binned" in f["Data"]
+                if exists:
+                    reply = QMessageBox.question(self, 'Update Binned file', f"Do you want to update the preexisting binned file?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+                if not exists or reply == QMessageBox.Yes:
+                    start_task(apply_step, filepath, {"treatment": "Bin", "parent": "Raw_data", "axis": axis, "start": start, "stop": stop},
+                               failed = lambda message: QMessageBox.critical(self, "Binning failure", f"Failed to bin the raw data: {message}"))
+                self.update_treeview(filepath)
+
+                for k in self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"].keys():
+                    self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"][k].hide()
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_apply_button"].hide()
+                
+            def update_line():
+                start = int(self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"]["bin_start_spinbox"].value())
+                stop = int(self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"]["child"]["bin_stop_spinbox"].value())
+                y = bin_prefix(prefix, start, stop)
+                x = np.arange(y.size)
+
+                # The line is created with the first window, then only its points are changed and blitted over the image
+                if preview["line"] is None or preview["line"].line.axes is None:
+                    for line in self.left_frame_dic["child"]["ax"].get_lines():
+                        line.remove()
+                    preview["line"] = BlitLine(self.left_frame_dic["child"]["ax"], x, y, 'r')
+                    self.left_frame_dic["child"]["ax"].set_xlim((0,arr.shape[0]))
+                    self.left_frame_dic["child"]["ax"].set_ylim((0,arr.shape[1]))
+                preview["line"].set_data(x, y)
+
+            # Hide combobox and button
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_bin_button"].hide()
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_bin"].hide()
+
+            #Retrieve axis on which apply the binning ("H" or "V")
+            axis = self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_bin"].currentData()
+
+            # Cumulative sums along the binned axis, from which any window is binned in a single subtraction
+            prefix = binning_prefix(arr, axis)
+            preview = {"line": None}
+
+            # Create a horizontal layout to hold the controls on the same line
+            bin_window_layout = QHBoxLayout()
+
+            # Set up the noise selection widgets
+            bin_start_spinbox = QSpinBox()
+            bin_start_spinbox.setFixedWidth(80)   # Adjust width as needed
+            bin_start_spinbox.setMinimum(0)
+            bin_start_spinbox.setValue(0)
+            bin_stop_spinbox = QSpinBox()
+            bin_stop_spinbox.setFixedWidth(80)   # Adjust width as needed
+            bin_stop_spinbox.setMinimum(0)
+            select_button = QPushButton("Apply Binning")
+            select_button.clicked.connect(self.activate_graph_selection)
+
+            # Add horizontal and veritcal specific values:
+            if axis == "H":
+                bin_start_label = QLabel("Starting column:")
+                bin_stop_label = QLabel("Ending column:")
+                bin_start_spinbox.setMaximum(arr.shape[0])
+                bin_stop_spinbox.setMaximum(arr.shape[0])
+                bin_stop_spinbox.setValue(arr.shape[0])
+            else:
+                bin_start_label = QLabel("Starting line:")
+                bin_stop_label = QLabel("Ending line:")
+                bin_start_spinbox.setMaximum(arr.shape[1])
+                bin_stop_spinbox.setMaximum(arr.shape[1])
+                bin_stop_spinbox.setValue(arr.shape[1])
+            
+            # "Apply" button
+            bin_apply_button = QPushButton("Apply")
+            bin_apply_button.clicked.connect(apply_binning)
+
+            # Add these widgets to the layout and the dictionnary
+            bin_window_layout.addWidget(bin_start_label)
+            bin_window_layout.addWidget(bin_start_spinbox)
+            bin_window_layout.addWidget(bin_stop_label)
+            bin_window_layout.addWidget(bin_stop_spinbox)
+
+            bin_window_dic = {"bin_start_label": bin_start_label,
+                              "bin_start_spinbox": bin_start_spinbox,
+                              "bin_stop_label": bin_stop_label,
+                              "bin_stop_spinbox": bin_stop_spinbox}
+            self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addLayout(bin_window_layout)
+            self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(bin_apply_button)
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_window_layout"] = {"elt": bin_window_layout,
+                                                                                                     "child": bin_window_dic}
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["bin_apply_button"] = bin_apply_button
+            bin_start_spinbox.valueChanged.connect(update_line)
+            bin_stop_spinbox.valueChanged.connect(update_line)
+
+        # Only the parts of the raw data that are displayed are read
+        if type(arr) == type(None): arr = LazyDataset(filepath)
+
+        # The file is only read here, a new frequency axis is stored in the pool of tasks once the file is closed
+        to_store = []
+
+        # Open bh5 file and get the frequency
+        with h5py.File(filepath, 'r') as f:
+            date_raw_data = f.attrs["MEASURE.Date_of_measure"]
+            
+            if len(arr.shape) == 1:
+                # Generate or retrieve the frequency axis
+                frequency, date_frequency = read_frequency(f)
+                if frequency is not None:
+                    # Plot the spectrum on a frequency axis, in place of the raw spectra that may still be read
+                    self.cancel_plot()
+                    self.left_frame_dic["child"]["ax"].clear()
+                    plot_decimated(self.left_frame_dic["child"]["ax"], frequency, arr[...])
+                    self.left_frame_dic["child"]["ax"].set_title(name)
+                    self.left_frame_dic["child"]["ax"].set_xlabel("Frequency shift (GHz)")
+                    self.spectral_unit = "frequency"
+                    self.left_frame_dic["child"]["ax"].set_ylabel("Counts on detector")
+                    self.left_frame_dic["child"]["canvas"].draw()
+            
+            elif len(arr.shape) == 2:
+                # Adds the possibility to bin the signal
+                date_frequency = "NONE"
+                combo_box_bin = QComboBox()
+                combo_box_bin.addItem("Bin signal options")
+                combo_box_bin.addItem("--Horizontally (sum along -)--", "H")
+                combo_box_bin.addItem("--Vertically (sum along |)--", "V")
+                combo_box_bin.activated.connect(button_bin_visible)
+                
+                add_bin_button = QPushButton("Bin")
+                add_bin_button.clicked.connect(bin_signal)
+                add_bin_button.setEnabled(False)
+                
+                self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(combo_box_bin)
+                self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(add_bin_button)
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_bin"] = combo_box_bin
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_bin_button"] = add_bin_button
+
+        for frequency, date, calibration in to_store:
+            start_task(write_frequency_axis, filepath, frequency, date, calibration,
+                       failed = lambda message: QMessageBox.critical(self, "Error", f"Failed to store the frequency axis: {message}"))
+        return date_frequency, date_raw_data
+
+    def initUI(self):
+        def populate_left_frame(self):
+            # Populate left frame
+            left_layout = QVBoxLayout()
+            fig = Figure(figsize=(5, 4), dpi=100)
+            canvas = FigureCanvas(fig)
+            ax = fig.add_subplot(111)
+            toolbar = NavigationToolbar(canvas, self)  # Add the Matplotlib toolbar
+            left_layout.addWidget(toolbar)  # Add toolbar at the top
+            left_layout.addWidget(canvas)  # Add canvas below the toolbar
+
+            dic_canvas = {"fig": fig,
+                          "canvas": canvas,
+                          "ax": ax,
+                          "toolbar": toolbar}
+            dic = {"elt": left_layout, "child": dic_canvas}
+            return dic
+            
+        def populate_right_frame(self):
+            right_layout = QVBoxLayout()
+            
+            # Define the three lqyouts of the treatment window
+            treat_selection_layout = QVBoxLayout()
+            treeview_layout = QVBoxLayout()
+            parameters_treat_layout = QVBoxLayout()
+
+            # Create widgets for the treat_selection layout
+            treat_all_spectra_button = QPushButton("Treat all selected spectra")
+            treat_all_spectra_button.clicked.connect(self.treat_all)
+            label_treat_all_spectra_button = QLabel("Or select Spectrum to treat:")
+            combo_box = QComboBox()
+            combo_box.addItem("Display All")
+            for spectrum in self.spectra_selected: combo_box.addItem(spectrum[1])
+            combo_box.currentIndexChanged.connect(self.select_spectrum)
+            treat_selected_spectrum_button = QPushButton("Treat selected spectrum")
+            treat_selected_spectrum_button.clicked.connect(self.treat_selected)
+            if len(self.spectra_selected)>1: treat_selected_spectrum_button.setEnabled(False)
+
+            # Position widgets
+            treat_selection_layout.addWidget(treat_all_spectra_button)
+            treat_selection_layout.addWidget(label_treat_all_spectra_button)
+            treat_selection_layout.addWidget(combo_box)
+            treat_selection_layout.addWidget(treat_selected_spectrum_button)
+
+            if len(self.spectra_selected) == 1:
+                treat_all_spectra_button.hide()
+                label_treat_all_spectra_button.hide()
+                combo_box.hide()
+            treat_selection_layout.addStretch()
+
+            # Organize right layout
+            right_layout.addLayout(treat_selection_layout)
+            right_layout.addLayout(treeview_layout)
+            right_layout.addLayout(parameters_treat_layout)
+
+            # Create the dictionnary of the elements
+            dic_treat_selection_layout = {"treat_all_spectra_button": treat_all_spectra_button,
+                                          "label_treat_all_spectra_button": label_treat_all_spectra_button,
+                                          "combo_box": combo_box,
+                                          "treat_selected_spectrum_button": treat_selected_spectrum_button}
+            dic_frames = {"treat_selection_layout": {"elt": treat_selection_layout, "child": dic_treat_selection_layout},
+                          "treeview_layout": {"elt": treeview_layout, "child": {}},
+                          "parameters_treat_layout": {"elt": parameters_treat_layout, "child": {}}}
+            dic = {"elt": right_layout, "child": dic_frames}
+            
+            return dic
+
+        # Main layout
+        main_layout = QHBoxLayout()
+
+        # Left and right layouts
+        left_frame = QFrame()
+        right_frame = QFrame()
+        
+        self.left_frame_dic = populate_left_frame(self)
+        left_frame.setLayout(self.left_frame_dic["elt"])
+        left_frame.setFixedWidth(500)  # Set fixed width for left section
+
+        self.right_frame_dic = populate_right_frame(self)
+        right_frame.setLayout(self.right_frame_dic["elt"])
+        right_frame.setFixedWidth(500)  # Set fixed width for left section
+
+        # Add both sections to the main layout
+        main_layout.addWidget(left_frame)
+        main_layout.addWidget(right_frame)
+
+        # Set layout in central widget
+        central_widget = QWidget()
+        central_widget.setLayout(main_layout)
+        self.setCentralWidget(central_widget)
+
+        # Plot all spectra by default
+        self.plot_all_spectra()
+
+    def plot_all_spectra(self):
+        self.left_frame_dic["child"]["ax"].clear()  # Clear previous plots
+        self.plot_raw_spectra([spectrum[2] for spectrum in self.spectra_selected], "All Selected Spectra")
+
+    def plot_raw_spectra(self, file_paths, title = "Raw Spectrum"):
+        # The raw data are read in the pool of tasks and plotted once read, unless an other plot was asked meanwhile
+        self.cancel_plot()
+        task = start_task(read_raw_data, file_paths, finished = lambda raw_data: self.plot_read_spectra(task, raw_data, title))
+        self.plot_task = task
+
+    def cancel_plot(self):
+        if getattr(self, "plot_task", None) is not None: self.plot_task.cancel()
+        self.plot_task = None
+
+    def plot_read_spectra(self, task, raw_data, title):
+        if task is not self.plot_task: return
+        self.plot_task = None
+        for file_path, data, error in raw_data:
+            if error is not None:
+                QMessageBox.warning(self, "Plot failure", f"Failed to load or plot raw spectrum of {os.path.basename(file_path)}: {error}")
+            else:
+                self.plot_raw_data(data, title, draw = False)
+        self.left_frame_dic["child"]["canvas"].draw()
+
+    def plot_raw_data(self, raw_data, title = "Raw Spectrum", draw = True):
+        try:
+            if len(raw_data.shape) == 1:
+                # Lines and frames are drawn at the resolution of the canvas, and again when zooming
+                plot_decimated(self.left_frame_dic["child"]["ax"], np.arange(raw_data.shape[0]), raw_data)
+                self.left_frame_dic["child"]["ax"].set_title(title)
+                self.left_frame_dic["child"]["ax"].set_xlabel("Spectral channels")
+                self.spectral_unit = "channel"
+                self.left_frame_dic["child"]["ax"].set_ylabel("Counts on detector")
+                if draw: self.left_frame_dic["child"]["canvas"].draw()
+            elif len(raw_data.shape) == 2:
+                imshow_pyramid(self.left_frame_dic["child"]["ax"], raw_data)
+                self.left_frame_dic["child"]["ax"].set_title(title)
+                self.left_frame_dic["child"]["ax"].set_xlabel("X (pixels)")
+                self.left_frame_dic["child"]["ax"].set_ylabel("Y (pixels)")
+                self.left_frame_dic["child"]["ax"].set_xlim((0,raw_data.shape[0]))
+                self.left_frame_dic["child"]["ax"].set_ylim((0,raw_data.shape[1]))
+                if draw: self.left_frame_dic["child"]["canvas"].draw()            
+
+        except Exception as e:
+            QMessageBox(self,"Plot failure",f"Failed to load or plot raw spectrum: {e}")
+
+    def select_spectrum(self):
+        self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box"]
+        selected_spectrum = self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box"].currentText()
+        self.left_frame_dic["child"]["ax"].clear()  # Clear previous plot
+
+        if selected_spectrum == "Display All":
+            self.plot_all_spectra()
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["treat_selected_spectrum_button"].setEnabled(False)
+        else:
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["treat_selected_spectrum_button"].setEnabled(True)
+            # Plot only the selected spectrum
+            print(selected_spectrum)
+            self.plot_raw_spectra([spectrum[2] for spectrum in self.spectra_selected if spectrum[1] == selected_spectrum], selected_spectrum)
+
+        self.left_frame_dic["child"]["canvas"].draw()
+
+    def treat_all(self):
+        # Replay a recipe exported from a treated spectrum on all the selected spectra
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Treatment Recipe", "", "Treatment Recipe (*.json);;All Files (*)")
+        if not file_path: return
+        try:
+            recipe = load_recipe(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Recipe", f"Failed to read the recipe: {e}")
+            return
+
+        # The steps are applied in the pool of tasks, the treatment stops after the current step when cancelled
+        filepaths = [spectrum[2] for spectrum in self.spectra_selected]
+        self.treat_progress = QProgressDialog("Treating spectra...", "Cancel", 0, len(recipe["steps"]), self)
+        self.treat_progress.setWindowModality(Qt.WindowModal)
+        self.treat_progress.show()
+        self.treat_task = start_task(replay_and_store, self.db_manager, filepaths, recipe, db_manager = self.db_manager,
+                                     progress = lambda done, total: self.treat_progress.setValue(done),
+                                     finished = lambda result: self.treat_all_finished(filepaths, *result),
+                                     failed = self.treat_all_failed,
+                                     cancelled = lambda: self.treat_all_finished(filepaths, None, [], None))
+        self.treat_progress.canceled.connect(self.treat_task.cancel)
+
+    def treat_all_failed(self, message):
+        self.treat_progress.close()
+        QMessageBox.critical(self, "Treatment", f"Treatment failed: {message}")
+
+    def treat_all_finished(self, filepaths, applied, failures, error):
+        self.treat_progress.close()
+        if applied is None:
+            QMessageBox.information(self, "Treatment", "Treatment cancelled, the spectra keep the steps applied before.")
+            return
+        if error is not None: QMessageBox.warning(self, "Treatment", f"Failed to copy the fit results to the database: {error}")
+        failed = dict(failures)
+        applied = {filepath: applied.get(filepath, []) for filepath in filepaths}
+        nb_treated = sum(1 for filepath in filepaths if applied[filepath] and filepath not in failed)
+        nb_up_to_date = sum(1 for filepath in filepaths if not applied[filepath] and filepath not in failed)
+        message = f"{nb_treated} spectra treated, {nb_up_to_date} already up to date."
+        if failures:
+            message += f"\n\n{len(failures)} failures:\n" + "\n".join(f"{os.path.basename(filepath)}: {error}" for filepath, error in failures[:20])
+            QMessageBox.warning(self, "Treatment", message)
+        else:
+            QMessageBox.information(self, "Treatment", message)
+
+    def export_recipe(self):
+        recipe = recipe_from_bh5(self.filepath)
+        if not recipe["steps"]:
+            QMessageBox.information(self, "Recipe", "No treatment was applied to this spectrum.")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Treatment Recipe", "", "Treatment Recipe (*.json)")
+        if not file_path: return
+        if not file_path.lower().endswith(".json"): file_path += ".json"
+        save_recipe(recipe, file_path)
+
+    def treat_selected(self):
+        def treat_parameters_layout(self):
+            def enable_treat_button():
+                self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_treatment_button"].setEnabled(True)
+
+            combo_box_treat = QComboBox()
+            combo_box_treat.addItem("Treatmen steps")
+            combo_box_treat.addItem("--Subtract Noise Average--")
+            combo_box_treat.addItem("--Normalize intensity of peak to unity--")
+            combo_box_treat.addItem("--Decovolve spectrum--")
+            combo_box_treat.addItem("--DHO fit on peak doublet with elastic peak compensation--")
+            combo_box_treat.addItem("--DHO fit on peak doublet without elastic peak compensation--")
+            combo_box_treat.addItem("--Lorentzian fit on peak doublet with elastic peak compensation--")
+            combo_box_treat.addItem("--Lorentzian fit on peak doublet without elastic peak compensation--")
+            combo_box_treat.activated.connect(enable_treat_button)
+
+            add_treatment_button = QPushButton("Add treatment to selected data")
+            add_treatment_button.clicked.connect(self.add_treatment)
+            add_treatment_button.setEnabled(False)
+
+            export_recipe_button = QPushButton("Export treatment recipe")
+            export_recipe_button.clicked.connect(self.export_recipe)
+
+            self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(combo_box_treat)
+            self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(add_treatment_button)
+            self.right_frame_dic["child"]["treat_selection_layout"]["elt"].addWidget(export_recipe_button)
+
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box_treat"] = combo_box_treat
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["add_treatment_button"] = add_treatment_button
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"]["export_recipe_button"] = export_recipe_button
+            
+        def treeview_layout(self, date_frequency, date_raw_data):
+            # Create a QTreeWidget for displaying treatment steps
+            treeview = QTreeWidget()
+            treeview.setColumnCount(2)
+            treeview.setHeaderLabels(["Name", "Date Created"])
+
+            treeview_treat_frequency_item = QTreeWidgetItem(["frequency", date_frequency])
+            treeview_treat_raw_data_item = QTreeWidgetItem(["raw_data", date_raw_data])
+
+            treeview.addTopLevelItem(treeview_treat_frequency_item)
+            treeview.addTopLevelItem(treeview_treat_raw_data_item)
+            treeview_dict = {"frequency": {"parent": treeview_treat_frequency_item}, 
+                                "raw_data": {"parent": treeview_treat_raw_data_item}}
+            
+            self.right_frame_dic["child"]["treeview_layout"]["elt"].addWidget(treeview)
+            
+            self.right_frame_dic["child"]["treeview_layout"]["child"] = {"elt": treeview, "child": treeview_dict}
+
+        def empty_treeview_layout(self):
+            # Create a QTreeWidget for displaying treatment steps
+            treeview = QTreeWidget()
+            treeview.setColumnCount(2)
+            treeview.setHeaderLabels(["Name", "Date Created"])
+
+            treeview_dic = {"elt": treeview, "child":{}}
+            self.right_frame_dic["child"]["treeview_layout"]["child"]["treeview"] = treeview_dic
+            self.right_frame_dic["child"]["treeview_layout"]["elt"].addWidget(treeview)
+
+            self.update_treeview(filepath)
+
+        # Clear the spectrum selection layout 
+        for k in self.right_frame_dic["child"]["treat_selection_layout"]["child"].keys():
+            self.right_frame_dic["child"]["treat_selection_layout"]["child"][k].hide()
+
+        # Extract the filepath of the file to treat
+        if len(self.spectra_selected) == 1:
+            selected_spectrum = self.spectra_selected[0][1]
+        else:
+            try: selected_spectrum = self.right_frame_dic["child"]["treat_selection_layout"]["child"]["combo_box"].currentText()
+            except: selected_spectrum = self.spectra_selected[0][1]
+        for spectrum in self.spectra_selected:
+            if spectrum[1] == selected_spectrum: filepath = spectrum[2]
+        self.filepath = filepath
+
+        empty_treeview_layout(self)
+
+        date_frequency, date_raw_data = self.get_frequency(filepath, selected_spectrum)
+
+        treat_parameters_layout(self)
+        # treeview_layout(self, date_frequency, date_raw_data)
+
+        self.right_frame_dic["elt"].addStretch()
+
+    def update_treeview(self, filepath):
+        # The datasets are listed in the pool of tasks, after the treatments started before
+        start_task(treatment_tree, filepath, finished = self.populate_treeview,
+                   failed = lambda message: QMessageBox.critical(self, "Error", f"Failed to read the treatments of the file: {message}"))
+
+    def populate_treeview(self, datasets):
+        self.right_frame_dic["child"]["treeview_layout"]["child"]["treeview"]["elt"].clear()
+        item_dict = {}  # Dictionary to hold references to QStandardItem by dataset name
+
+        parents = {}
+        for dataset_name, creation_date, parent_name in datasets:
+            # Create a QTreeWidgetItem with the dataset name and creation date
+            dataset_item = QTreeWidgetItem([dataset_name, creation_date])
+
+            # Add dataset_item to the dictionary for reference by other datasets
+            item_dict[dataset_name] = dataset_item
+            parents[dataset_name] = parent_name
+
+        # Items are attached once they all exist, as children can be listed before their parent
+        for dataset_name, dataset_item in item_dict.items():
+            parent_name = parents[dataset_name]
+            if parent_name is None or parent_name not in item_dict:
+                # No "Parent" attribute or parent not found: add as top-level item
+                self.right_frame_dic["child"]["treeview_layout"]["child"]["treeview"]["elt"].addTopLevelItem(dataset_item)
+            else:
+                # Add as a child of the specified parent item
+                item_dict[parent_name].addChild(dataset_item)
+
+    def treat_fit(self, model, parent):
+        # Ask before replacing a previous fit
+        with h5py.File(self.filepath, 'r') as f:
+            exists = model.name+"_fit" in f["Data"]
+        if exists:
+            reply = QMessageBox.question(self, 'Update fit', f"Do you want to update the preexisting {model.name} fit?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes: return
+
+        # Spectra of maps start from the parameters of their fitted neighbour
+        filepath = self.filepath
+        start_task(treat_and_store, self.db_manager, filepath,
+                   {"treatment": "Fit", "parent": parent, "model": model.name, "elastic_compensation": model.elastic_compensation, "warm_start": True},
+                   db_manager = self.db_manager, finished = lambda result: self.update_treeview(filepath),
+                   failed = lambda message: QMessageBox.critical(self, "Fit failure", f"Failed to fit the spectra of {parent}: {message}"))
+
+    def treat_deconvolve(self, parent):
+        # Ask for an impulse response if the file doesn't have one
+        with h5py.File(self.filepath, 'r') as f:
+            try:
+                read_impulse_response(f)
+                stored = True
+            except ValueError:
+                stored = False
+            exists = "Deconvolved" in f["Data"]
+        if not stored:
+            file_path, _ = QFileDialog.getOpenFileName(self, "Open Impulse Response", "", "Impulse Response (*.npy *.txt *.dat *.csv);;All Files (*)")
+            if not file_path: return
+            try:
+                if file_path.lower().endswith(".npy"): impulse_response = np.load(file_path)
+                else: impulse_response = np.loadtxt(file_path, delimiter="," if file_path.lower().endswith(".csv") else None)
+                store_impulse_response(self.filepath, impulse_response)
+            except Exception as e:
+                QMessageBox.critical(self, "Impulse response", f"Failed to read the impulse response: {e}")
+                return
+
+        if exists:
+            reply = QMessageBox.question(self, 'Update deconvolution', "Do you want to update the preexisting deconvolved spectra?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes: return
+
+        method, ok = QInputDialog.getItem(self, "Deconvolution", "Method:", ["Wiener", "Richardson-Lucy"], 0, False)
+        if not ok: return
+        filepath = self.filepath
+        start_task(apply_step, filepath, {"treatment": "Deconvolve", "parent": parent, "method": method},
+                   finished = lambda result: self.update_treeview(filepath),
+                   failed = lambda message: QMessageBox.critical(self, "Deconvolution failure", f"Failed to deconvolve the spectra of {parent}: {message}"))
+
+    def treat_normalize(self, parent):
+        # Ask before replacing previous normalized spectra
+        with h5py.File(self.filepath, 'r') as f:
+            exists = "Normalized" in f["Data"]
+        if exists:
+            reply = QMessageBox.question(self, 'Update normalization', "Do you want to update the preexisting normalized spectra?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes: return
+
+        # The frequency axis of each spectrum is centred on its elastic peak, then the chosen peak is normalized
+        peak, ok = QInputDialog.getItem(self, "Normalization", "Peak normalized to unity:", ["Brillouin", "Elastic"], 0, False)
+        if not ok: return
+        filepath = self.filepath
+        start_task(apply_step, filepath, {"treatment": "Normalize", "parent": parent, "peak": peak},
+                   finished = lambda result: self.update_treeview(filepath),
+                   failed = lambda message: QMessageBox.critical(self, "Normalization failure", f"Failed to normalize the spectra of {parent}: {message}"))
+
+    def treat_subtract_noise_average(self, parent):
+        # Noise windows are typed or selected on the graph, then their average is subtracted from all the spectra of the parent
+        self.noise_parent = parent
+        self.noise_windows = []
+        layout = self.right_frame_dic["child"]["treat_selection_layout"]
+        if "noise_window_layout" in layout["child"]:
+            for widget in layout["child"]["noise_window_layout"]["child"].values():
+                widget.show()
+            self.update_noise_windows()
+            return
+
+        noise_window_layout = QVBoxLayout()
+        noise_windows_label = QLabel()
+        window_layout = QHBoxLayout()
+        window_start_spinbox = QDoubleSpinBox()
+        window_stop_spinbox = QDoubleSpinBox()
+        for spinbox in (window_start_spinbox, window_stop_spinbox):
+            spinbox.setRange(-1e6, 1e6)
+            spinbox.setDecimals(3)
+            spinbox.setFixedWidth(80)   # Adjust width as needed
+        select_button = QPushButton("Select")
+        select_button.clicked.connect(self.activate_graph_selection)
+        add_window_button = QPushButton("Add noise window")
+        add_window_button.clicked.connect(self.add_noise_window)
+        apply_button = QPushButton("Apply")
+        apply_button.clicked.connect(self.apply_noise_window)
+
+        noise_window_dic = {"noise_windows_label": noise_windows_label,
+                            "window_start_label": QLabel("Window Start:"),
+                            "window_start_spinbox": window_start_spinbox,
+                            "window_stop_label": QLabel("Window Stop:"),
+                            "window_stop_spinbox": window_stop_spinbox,
+                            "select_button": select_button,
+                            "add_window_button": add_window_button,
+                            "apply_button": apply_button}
+        for k in ("window_start_label", "window_start_spinbox", "window_stop_label", "window_stop_spinbox", "select_button"):
+            window_layout.addWidget(noise_window_dic[k])
+        noise_window_layout.addWidget(noise_windows_label)
+        noise_window_layout.addLayout(window_layout)
+        noise_window_layout.addWidget(add_window_button)
+        noise_window_layout.addWidget(apply_button)
+        layout["elt"].addLayout(noise_window_layout)
+        layout["child"]["noise_window_layout"] = {"elt": noise_window_layout, "child": noise_window_dic}
+        self.update_noise_windows()
+
+    def noise_widget(self, name):
+        return self.right_frame_dic["child"]["treat_selection_layout"]["child"]["noise_window_layout"]["child"][name]
+
+    def update_noise_windows(self):
+        unit = "GHz" if self.spectral_unit == "frequency" else "channels"
+        windows = ", ".join(f"[{low:g}, {high:g}]" for low, high in self.noise_windows) if self.noise_windows else "none"
+        self.noise_widget("noise_windows_label").setText(f"Noise windows of {self.noise_parent} ({unit}): {windows}")
+
+    def add_noise_window(self):
+        low = self.noise_widget("window_start_spinbox").value()
+        high = self.noise_widget("window_stop_spinbox").value()
+        self.noise_windows.append((min(low, high), max(low, high)))
+        self.highlight_region(low, high)
+        self.update_noise_windows()
+
+    def activate_graph_selection(self):
+        # Enable graph interactivity
+        self.clicks = []
+        self.cid = self.left_frame_dic["child"]["canvas"].mpl_connect("button_press_event", self.on_click)
+
+    def on_click(self, event):
+        # Record click positions and draw vertical lines
+        if event.xdata is None or len(self.clicks) >= 2: return
+        self.clicks.append(event.xdata)
+        self.left_frame_dic["child"]["ax"].axvline(event.xdata, color="red")
+        self.left_frame_dic["child"]["canvas"].draw()
+
+        # Populate the spinboxes with the selected points, the window is added with the second point
+        if len(self.clicks) == 1:
+            self.noise_widget("window_start_spinbox").setValue(self.clicks[0])
+        else:
+            self.noise_widget("window_stop_spinbox").setValue(self.clicks[1])
+            self.left_frame_dic["child"]["canvas"].mpl_disconnect(self.cid)
+            self.add_noise_window()
+
+    def highlight_region(self, low, high):
+        # Highlight the region of a noise window
+        self.left_frame_dic["child"]["ax"].axvspan(low, high, color="yellow", alpha=0.3)
+        self.left_frame_dic["child"]["canvas"].draw()
+
+    def apply_noise_window(self):
+        if not self.noise_windows:
+            QMessageBox.warning(self, "Noise Window", "Please add at least one noise window.")
+            return
+        with h5py.File(self.filepath, 'r') as f:
+            exists = "Noise_subtracted" in f["Data"]
+        if exists:
+            reply = QMessageBox.question(self, 'Update noise subtraction', "Do you want to update the preexisting noise subtracted spectra?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes: return
+
+        filepath, parent = self.filepath, self.noise_parent
+        step = {"treatment": "Subtract Noise", "parent": parent, "windows": [list(e) for e in self.noise_windows], "unit": self.spectral_unit}
+        for widget in self.right_frame_dic["child"]["treat_selection_layout"]["child"]["noise_window_layout"]["child"].values():
+            widget.hide()
+        start_task(apply_step, filepath, step, finished = lambda result: self.update_treeview(filepath),
+                   failed = lambda message: QMessageBox.critical(self, "Noise subtraction failure", f"Failed to subtract the noise of {parent}: {message}"))
@@ -0,0 +1,256 @@
+import h5py
+import numpy as np
+from datetime import datetime
+from lazy_data import block_slices
+from calibration import calibrated_axis
+
+def now():
+    """Returns the date stored with the treated data."""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def frequency_source(f, nb_channels):
+    """Returns the frequency axis of an open BH5 file and the hash of the calibration it was computed from (None for a
+    stored axis or the axis of a TFP scan).
+
+    The axis is the stored "Frequency" dataset, the axis given by the calibration curve or the abscissa of the file,
+    or the axis of a TFP scan. A stored axis that wasn't computed from the current calibration of the file is computed
+    again.
+    """
+    try:
+        calibrated, error = calibrated_axis(f, nb_channels), None
+    except ValueError as e:
+        # A calibration that doesn't match the channels is only an error when there is no other axis
+        calibrated, error = None, e
+    if "Frequency" in f["Data"] and f["Data"]["Frequency"].shape[-1] == nb_channels:
+        stored = f["Data"]["Frequency"]
+        if calibrated is None or stored.attrs.get("Calibration_Hash") == calibrated[1]: return stored[...], None
+    if calibrated is not None: return calibrated
+    if f.attrs.get("SPECTROMETER.Type") == "TFP":
+        scan_amplitude = float(f.attrs["SPECTROMETER.Scan_Amplitude"])
+        return np.linspace(-scan_amplitude/2, scan_amplitude/2, nb_channels), None
+    if error is not None: raise error
+    raise ValueError("No frequency axis is associated to the data")
+
+def frequency_axis(f, nb_channels):
+    """Returns the frequency axis of an open BH5 file (see frequency_source)."""
+    return frequency_source(f, nb_channels)[0]
+
+def store_frequency_axis(f, nb_channels):
+    """Returns the frequency axis of an open BH5 file and stores it in the "Frequency" dataset if it isn't already.
+
+    An axis computed from a calibration replaces the stored one, and is stored with the hash of the calibration.
+    """
+    frequency, calibration = frequency_source(f, nb_channels)
+    if "Frequency" in f["Data"]:
+        if calibration is None: return frequency
+        del f["Data"]["Frequency"]
+    f["Data"].create_dataset("Frequency", data=frequency)
+    f["Data"]["Frequency"].attrs["Date"] = now()
+    if calibration is not None: f["Data"]["Frequency"].attrs["Calibration_Hash"] = calibration
+    return frequency
+
+def bin_image(arr, axis, start, stop):
+    """Sums an image horizontally ("H": columns start to stop) or vertically ("V": lines start to stop).
+
+    The binned signal is scaled so that its maximum is the length of the summed axis, as displayed over the image.
+    The image can be a dataset, it is then read block by block (see bin_rois).
+    """
+    if axis not in ("H", "V"): raise ValueError(f"Unknown binning axis: {axis}")
+    y = bin_rois(arr, [1 if axis == "H" else 0], [[(start, stop)]])[0]
+    return y/np.max(y)*arr.shape[0 if axis == "H" else 1]
+
+def roi_weights(shape, rois):
+    """Returns the weights of ROIs over binned axes of the given shape, stacked along a first axis.
+
+    A ROI is either a list of (start, stop) windows, one for each binned axis, or an array of weights of the given
+    shape (a weighted mask).
+    """
+    weights = np.zeros((len(rois),) + tuple(shape))
+    for weight, roi in zip(weights, rois):
+        if np.shape(roi) == (len(shape), 2):
+            weight[tuple(slice(int(start), int(stop)) for start, stop in roi)] = 1
+        elif np.shape(roi) == tuple(shape):
+            weight[...] = roi
+        else:
+            raise ValueError(f"A ROI is either {len(shape)} (start, stop) windows or weights of shape {tuple(shape)}, not of shape {np.shape(roi)}")
+    return weights
+
+def weighted_sums(block, weights, axes):
+    """Returns the sums of an array over the binned axes weighted by each ROI, the ROIs being along the first axis."""
+    if axes == list(range(axes[0], axes[-1] + 1)):
+        # Consecutive binned axes are summed by a single product, without moving the axes of the array
+        before, after = block.shape[:axes[0]], block.shape[axes[-1] + 1:]
+        sums = np.matmul(weights.reshape(len(weights), -1), block.reshape(int(np.prod(before)), -1, int(np.prod(after))))
+        return np.moveaxis(sums.reshape(before + (len(weights),) + after), len(before), 0)
+    return np.moveaxis(np.tensordot(block, weights, axes=(axes, list(range(1, weights.ndim)))), -1, 0)
+
+def bin_rois(data, axes, rois, max_bytes=2**22, progress=None):
+    """Sums an array or a dataset over the binned axes, weighted by each ROI (see roi_weights).
+
+    Datasets are read in a single pass by blocks of whole chunks of about max_bytes, and only the part of the blocks
+    within the bounding box of the ROIs is read, so that stacks larger than the memory can be binned. The sums of all
+    the ROIs are computed at once for each block. progress(done, total) is called after each block. Returns an array
+    of shape (number of ROIs,) + the shape of the axes that aren't binned.
+    """
+    shape = data.shape
+    axes = sorted(set(axis % len(shape) for axis in axes))
+    if not axes: raise ValueError("No axis to bin")
+    kept = [axis for axis in range(len(shape)) if axis not in axes]
+    weights = roi_weights([shape[axis] for axis in axes], rois)
+    result = np.zeros((len(rois),) + tuple(shape[axis] for axis in kept))
+
+    # Bounding box of the ROIs along the binned axes
+    bounds = {}
+    for i, axis in enumerate(axes):
+        inside = np.flatnonzero(np.any(weights, axis=tuple(j for j in range(weights.ndim) if j != i + 1)))
+        if inside.size == 0: return result
+        bounds[axis] = (inside[0], inside[-1] + 1)
+
+    blocks = list(block_slices(shape, data.dtype.itemsize, getattr(data, "chunks", None), max_bytes))
+    for done, block_index in enumerate(blocks, 1):
+        index = list(block_index) + [slice(None)]*(len(shape) - len(block_index))
+        for axis, (low, high) in bounds.items():
+            start, stop, _ = index[axis].indices(shape[axis])
+            index[axis] = slice(max(start, low), max(min(stop, high), max(start, low)))
+        weight = weights[(slice(None),) + tuple(index[axis] for axis in axes)]
+        # Blocks outside of all the ROIs aren't read
+        if weight.any():
+            block = np.asarray(data[tuple(index)], dtype=np.float64)
+            result[(slice(None),) + tuple(index[axis] for axis in kept)] += weighted_sums(block, weight, axes)
+        if progress is not None: progress(done, len(blocks))
+    return result
+
+def binning_prefix(arr, axis):
+    """Returns the cumulative sums of an image along the axis summed by bin_image, preceded by a line of zeros.
+
+    The sum of the columns ("H") or lines ("V") start to stop is then prefix[stop] - prefix[start], whatever the window.
+    """
+    if axis not in ("H", "V"): raise ValueError(f"Unknown binning axis: {axis}")
+    arr = np.asarray(arr[...], dtype=np.float64)
+    if axis == "H": arr = arr.T
+    prefix = np.zeros((arr.shape[0] + 1,) + arr.shape[1:])
+    np.cumsum(arr, axis = 0, out = prefix[1:])
+    return prefix
+
+def bin_prefix(prefix, start, stop):
+    """Returns the binned signal of bin_image from the cumulative sums of binning_prefix."""
+    start, stop = min(max(start, 0), len(prefix) - 1), min(max(stop, 0), len(prefix) - 1)
+    y = prefix[max(start, stop)] - prefix[start]
+    maximum = np.max(y)
+    return y/maximum*y.size if maximum else y
+
+def treatment_tree(filepath):
+    """Returns the (name, creation date, parent) of the datasets of the Data group of a BH5 file, as displayed in the treeview."""
+    with h5py.File(filepath, "r") as f:
+        return [(name, dataset.attrs.get("Date", f.attrs["MEASURE.Date_of_measure"]), dataset.attrs.get("Parent", None))
+                for name, dataset in f["Data"].items()]
+
+def noise_mask(axis, windows):
+    """Returns the mask of the channels of a spectral axis (frequency or channel number) within any of the (low, high) windows."""
+    mask = np.zeros(np.shape(axis), dtype=bool)
+    for low, high in windows:
+        mask |= (axis >= min(low, high)) & (axis <= max(low, high))
+    if not mask.any(): raise ValueError(f"No channel in the noise windows {windows}")
+    return mask
+
+def subtract_noise_average(spectra, mask):
+    """Subtracts from each spectrum (last axis) of an array the mean of its channels in the mask.
+
+    Counts are returned as floats, in single precision unless the spectra need more.
+    """
+    result = np.array(spectra, dtype=np.result_type(spectra.dtype, np.float32))
+    # The masked mean of all the spectra is a single product with the weights of the channels of the mask
+    noise = result @ (mask/np.count_nonzero(mask)).astype(result.dtype)
+    result -= noise[..., np.newaxis]
+    return result
+
+def subpixel_maximum(spectra, inside):
+    """Returns the fractional channel and the height of the maximum of each spectrum (last axis) among the channels of a mask.
+
+    The highest channel is refined by the parabola through it and its two neighbours, maxima on the first or the last
+    channel are kept as they are.
+    """
+    last = spectra.shape[-1] - 1
+    index = np.argmax(np.where(inside, spectra, -np.inf), axis=-1)[..., np.newaxis]
+    left, center, right = (np.take_along_axis(spectra, e, axis=-1)[..., 0].astype(np.float64)
+                           for e in (np.maximum(index - 1, 0), index, np.minimum(index + 1, last)))
+    index = index[..., 0]
+    curvature = left - 2*center + right
+    # Maxima on the border of the mask whose neighbour outside of it is higher are kept as they are as well
+    refined = (index > 0) & (index < last) & (center >= left) & (center >= right) & (curvature < 0)
+    delta = np.where(refined, 0.5*(left - right)/np.where(refined, curvature, -1), 0)
+    return index + delta, center - 0.25*(left - right)*delta
+
+def normalize_peaks(frequency, spectra, exclusion=None, peak="Brillouin"):
+    """Centres the frequency axis of each spectrum (last axis) of a stack on its elastic peak and normalizes a peak to unity.
+
+    The elastic peak is the maximum of the channels closer to 0 than exclusion (default: a quarter of the frequency
+    range, as for the fits) and the Brillouin peak the maximum of the other channels, both refined to a fraction of
+    channel. The intensity of the Brillouin or of the elastic peak is normalized, after the noise was subtracted.
+    Returns a dictionary of the normalized spectra, of the centred frequency axis of each spectrum ("Frequency"), of
+    the position of the elastic peak ("Elastic_Shift"), of the distance of the Brillouin peak to it ("Brillouin_Shift")
+    and of the intensity of the normalized peak ("Peak_Intensity").
+    """
+    if peak not in ("Brillouin", "Elastic"): raise ValueError(f"Unknown peak: {peak}")
+    frequency = np.asarray(frequency, dtype=float)
+    if exclusion is None: exclusion = 0.25*np.max(np.abs(frequency))
+    elastic = np.abs(frequency) <= exclusion
+    if elastic.all() or not elastic.any(): raise ValueError(f"The exclusion {exclusion} leaves no channel to the elastic or the Brillouin peak")
+    spectra = np.array(spectra, dtype=np.result_type(spectra.dtype, np.float32))
+    channels = np.arange(frequency.size)
+    # Both peaks of all the spectra are found at once
+    elastic_index, elastic_height = subpixel_maximum(spectra, elastic)
+    brillouin_index, brillouin_height = subpixel_maximum(spectra, ~elastic)
+    elastic_shift = np.interp(elastic_index, channels, frequency)
+    brillouin_shift = np.abs(np.interp(brillouin_index, channels, frequency) - elastic_shift)
+    intensity = brillouin_height if peak == "Brillouin" else elastic_height
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spectra /= intensity[..., np.newaxis].astype(spectra.dtype)
+    return {"Spectra": spectra,
+            "Frequency": (frequency - elastic_shift[..., np.newaxis]).astype(spectra.dtype),
+            "Elastic_Shift": elastic_shift,
+            "Brillouin_Shift": brillouin_shift,
+            "Peak_Intensity": intensity}
+
+def iter_blocks(dataset, max_bytes=2**26):
+    """Yields the (slices, block) blocks of whole spectra of an open dataset, made of whole chunks and of about max_bytes."""
+    for index in block_slices(dataset.shape, dataset.dtype.itemsize, dataset.chunks, max_bytes):
+        yield index, dataset[index]
+
+def set_treatment_attributes(obj, parent, parameters):
+    """Sets the date, parent and parameters of a treatment, as displayed in the treeview of the treatment window."""
+    obj.attrs["Date"] = now()
+    obj.attrs["Parent"] = parent
+    for key, value in parameters.items():
+        obj.attrs[key] = str(value)
+
+def write_treated_dataset(group, name, data, parent, **parameters):
+    """Creates or replaces a dataset derived from the parent dataset."""
+    if name in group: del group[name]
+    dataset = group.create_dataset(name, data=data)
+    set_treatment_attributes(dataset, parent, parameters)
+    return dataset
+
+def create_treated_dataset(group, name, like, dtype, parent, **parameters):
+    """Creates or replaces an empty dataset derived from the parent dataset, with the shape and storage layout of like."""
+    if name in group: del group[name]
+    dataset = group.create_dataset(name, shape=like.shape, dtype=dtype, chunks=like.chunks, compression=like.compression,
+                                   compression_opts=like.compression_opts, shuffle=like.shuffle)
+    set_treatment_attributes(dataset, parent, parameters)
+    return dataset
+
+def create_treated_group(group, name, parent, **parameters):
+    """Creates or replaces an empty group holding the results of a treatment of the parent dataset."""
+    if name in group: del group[name]
+    subgroup = group.create_group(name)
+    set_treatment_attributes(subgroup, parent, parameters)
+    return subgroup
+
+def write_treated_group(group, name, results, parent, **parameters):
+    """Creates or replaces a group holding the results of a treatment of the parent dataset."""
+    if name in group: del group[name]
+    subgroup = group.create_group(name)
+    for key, value in results.items():
+        subgroup.create_dataset(key, data=value)
+    set_treatment_attributes(subgroup, parent, parameters)
+    return subgroup